@@ -1,8 +1,26 @@
-import uvicorn
+import argparse
 
 
 def main():
-    uvicorn.run("youtube_summarizer.api:app", host="0.0.0.0", port=8008, reload=False)
+    parser = argparse.ArgumentParser(prog="youtube-summarizer")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="Run the API server (the default)")
+    worker = commands.add_parser("worker", help="Run pipeline stages queued by an API server in remote execution mode")
+    worker.add_argument(
+        "--stages",
+        default="download,transcribe,summarize",
+        help="Comma-separated stages this worker takes (default: all of them)",
+    )
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        from .worker import run
+
+        run([stage.strip() for stage in args.stages.split(",") if stage.strip()])
+    else:
+        import uvicorn
+
+        uvicorn.run("youtube_summarizer.api:app", host="0.0.0.0", port=8008, reload=False)
 
 
 if __name__ == "__main__":
@@ -1,27 +1,47 @@
 from .download import download_video_audio
 from .scribe import transcribe_audio
-from .summarize import summarize_transcript
-from .summaryjobs import get_job, create_job, close_job
+from .summarize import summarize_transcript, SegmentFeed
+from .summaryjobs import get_job, claim_job, close_job
 from .chatjobs import get_chat_job, create_chat_job, close_chat_job
+from .batchjobs import create_batch_job, close_batch_job, get_batch_job
+from .playlists import expand_urls
 from .chat import load_chat_history, ask_question
-
-from .utils import extract_url_id
-
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from .retrieval import indexes
+from .subscribers import stream_events, HEARTBEAT, RESYNC
+from .scheduler import in_stage_slot, schedule, stage_slot
+from .stages import executor
+from .whisper_models import models
+from .llm import test_connection
+from .llm_cache import response_cache
+from .artifacts import ensure_artifact, artifact_response, remove_artifacts, not_modified, summary_path
+from .transcripts import transcript_path, open_transcript, remove_transcript
+from . import broker, search
+from .search import remove_from_index
+
+from .utils import extract_url_id, AUDIO_EXTENSIONS
+
+from fastapi import FastAPI, Request, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
+import base64
 import json
 import os
-import sys
-from tinydb import Query
+from contextlib import asynccontextmanager
+from typing import Literal
 from fastapi.staticfiles import StaticFiles
 
 from starlette.responses import StreamingResponse
 
-from .database import videos
-from .config import SUMMARIES_DIR, TRANS_DIR, DOWNLOAD_DIR
-from .config_manager import config_manager
+from .database import videos, journal
+from .logs import logger
+from . import config
+from .config import SUMMARIES_DIR, DOWNLOAD_DIR
+from .config_manager import config_manager, RESTART_KEYS
+
+# Largest page /api/videos returns at once
+MAX_PAGE_SIZE = 500
 
 
 # Pydantic models for configuration
@@ -38,12 +58,52 @@ class ConfigUpdate(BaseModel):
     OPENROUTER_APP_NAME: str = None
     OPENROUTER_SITE_URL: str = None
     OPENROUTER_API_KEY: str = None
+    STAGE_WORKERS: int = None
+    TOKEN_FLUSH_INTERVAL_MS: int = None
+    TOKEN_FLUSH_BYTES: int = None
+    SUBSCRIBER_QUEUE_SIZE: int = None
+    SLOW_CONSUMER_POLICY: str = None
+    SSE_HEARTBEAT_SECONDS: int = None
+    DOWNLOAD_CONCURRENCY: int = None
+    TRANSCRIBE_CONCURRENCY: int = None
+    SUMMARIZE_CONCURRENCY: int = None
+    SUMMARY_PARALLELISM: int = None
+    PIPELINE_MODE: str = None
+    AUDIO_INGEST: str = None
+    STREAM_WINDOW_SECONDS: int = None
+    AUDIO_FORMAT: str = None
+    WHISPER_CPU_THREADS: int = None
+    WHISPER_NUM_WORKERS: int = None
+    WHISPER_IDLE_UNLOAD_SECONDS: int = None
+    TRANSCRIBE_PROCESSES: int = None
+    TRANSCRIBE_WINDOW_SECONDS: int = None
+    LLM_CACHE_MAX_MB: int = None
+    CHAT_CONTEXT_TOKENS: int = None
+    CHAT_WINDOW_TOKENS: int = None
+    CHAT_HISTORY_TOKENS: int = None
+    LLM_CONCURRENCY: int = None
+    EXECUTION_MODE: str = None
 
     class Config:
         extra = "forbid"  # Don't allow extra fields
 
 
-app = FastAPI()
+class BatchRequest(BaseModel):
+    urls: list[str] = []
+    # A single URL, for clients that only send one
+    url: str | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Videos processed before search existed are indexed in the background
+    asyncio.get_running_loop().run_in_executor(executor, search.backfill)
+    broker.clear_pending()
+    resume_jobs()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -52,6 +112,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets polling clients read the ETag and send it back as If-None-Match
+    expose_headers=["ETag"],
 )
 
 @app.get("/api/summary/{video_id}/status")
@@ -67,8 +129,7 @@ async def get_summary_status(video_id: str):
     # Check if summary file exists
     summary_filepath = f"{SUMMARIES_DIR}/{video_id}.md"
     if os.path.exists(summary_filepath):
-        q = Query()
-        video_doc = videos.get(q.video_id == video_id)
+        video_doc = videos.get(video_id)
         
         if video_doc:
             return {
@@ -84,8 +145,7 @@ async def get_summary_status(video_id: str):
             }
     
     # Video doesn't exist or hasn't been processed
-    q = Query()
-    video_doc = videos.get(q.video_id == video_id)
+    video_doc = videos.get(video_id)
     
     if video_doc:
         return {
@@ -97,32 +157,65 @@ async def get_summary_status(video_id: str):
 
 
 @app.get("/api/summary/{video_id}")
-async def get_summary_content(video_id: str):
+async def get_summary_content(video_id: str, request: Request):
     """Return summary markdown content for a video."""
-    summary_filepath = f"{SUMMARIES_DIR}/{video_id}.md"
-    
-    if os.path.exists(summary_filepath):
-        with open(summary_filepath, "r") as f:
-            return {"content": f.read()}
-    
-    raise HTTPException(status_code=404, detail="Summary not found")
+    path = await asyncio.get_running_loop().run_in_executor(executor, ensure_artifact, "summary", video_id)
 
+    if path:
+        return artifact_response(request, path)
 
+    raise HTTPException(status_code=404, detail="Summary not found")
 
 
+@app.get("/api/transcript/{video_id}")
+async def get_transcript(
+    video_id: str,
+    request: Request,
+    time_from: float | None = Query(None, alias="from", ge=0),
+    time_to: float | None = Query(None, alias="to", ge=0),
+):
+    """Return transcript with timestamps for a video, or only the segments between `from` and `to` seconds."""
+    if time_from is not None or time_to is not None:
+        return await get_transcript_range(video_id, request, time_from, time_to)
 
+    path = await asyncio.get_running_loop().run_in_executor(executor, ensure_artifact, "transcript", video_id)
+
+    if path:
+        return artifact_response(request, path)
 
-@app.get("/api/transcript/{video_id}")
-async def get_transcript(video_id: str):
-    """Return transcript with timestamps for a video."""
-    json_filepath = f"{TRANS_DIR}/{video_id}.json"
-    if os.path.exists(json_filepath):
-        with open(json_filepath, "r") as f:
-            return {"transcript": json.load(f)}
-    
     raise HTTPException(status_code=404, detail="Transcript not found")
 
 
+async def get_transcript_range(video_id: str, request: Request, time_from: float | None, time_to: float | None):
+    # Opening the transcript may convert a legacy JSON file first, so it happens off the event loop
+    transcript = await asyncio.get_running_loop().run_in_executor(executor, open_transcript, video_id)
+    if not transcript:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+
+    with transcript:
+        stat = transcript_path(video_id).stat()
+        headers = {
+            "ETag": f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}-{time_from}-{time_to}"',
+            "Cache-Control": "no-cache",
+        }
+        if not_modified(request, headers["ETag"], stat.st_mtime):
+            return Response(status_code=304, headers=headers)
+
+        return JSONResponse({"transcript": transcript.between(time_from, time_to)}, headers=headers)
+
+
+@app.get("/api/search")
+async def search_library(
+    q: str,
+    kind: Literal["transcript", "summary"] | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Search every transcript and summary. Transcript hits carry the start time of the matching segment."""
+    hits = await asyncio.get_running_loop().run_in_executor(executor, search.search, q, kind, limit, offset)
+    return {"results": hits}
+
+
 @app.post("/api/summarize")
 async def summarize_video_endpoint(request: Request):
     """Download, transcribe, and summarize a YouTube video."""
@@ -134,52 +227,157 @@ async def summarize_video_endpoint(request: Request):
     if not video_id:
         return {"error": "Invalid YouTube URL"}
 
-    job = create_job(video_id)
-    asyncio.create_task(summarize_video(video_id))
+    # A video already being processed keeps its job; the client follows that one instead
+    if not claim_job(video_id):
+        return {"success": True, "video_id": video_id, "message": "Already processing"}
+    schedule(summarize_video(video_id))
 
     return {"success": True, "video_id": video_id, "message": "Processing started"}
 
 
+@app.post("/api/batch")
+async def summarize_batch_endpoint(request: BatchRequest):
+    """Summarize every video of a list of video, playlist and channel URLs that isn't summarized yet."""
+    urls = request.urls or ([request.url] if request.url else [])
+
+    if not urls:
+        raise HTTPException(status_code=400, detail="At least one URL is required")
+
+    batch = create_batch_job()
+    schedule(run_batch(batch, urls))
+
+    return {"success": True, "batch_id": batch.batch_id, "message": "Batch started"}
+
+
+@app.get("/api/batch/{batch_id}/subscribe")
+async def keep_batch_client_updated(batch_id: str, request: Request):
+    batch = get_batch_job(batch_id)
+
+    if not batch:
+        return {"error": "No batch with this id"}
+
+    client_id, subscriber = batch.add_client()
+
+    async def event_stream():
+        try:
+            yield f"data: {batch.get_state()}\n\n"
+
+            async for data in stream_events(subscriber, request):
+                if data is HEARTBEAT:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                # The client fell behind and its backlog was dropped, send the whole state again
+                if data is RESYNC:
+                    yield f"data: {batch.get_state()}\n\n"
+                    continue
+
+                if data == "close":
+                    yield 'event: close\ndata: {"message": "Stream closed by server"}\n\n'
+                    break
+
+                yield f"event: update\ndata: {json.dumps(data)}\n\n"
+        finally:
+            batch.remove_client(client_id)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.get("/api/summarize/{video_id}/subscribe")
-async def keep_client_updated(video_id: str):
+async def keep_client_updated(video_id: str, request: Request):
     job = get_job(video_id)
 
     if not job:
         return {"error": "No job for this video id"}
 
-    client_id, q = job.add_client()
+    client_id, subscriber = job.add_client()
 
     async def event_stream():
-        yield f"data: {job.get_state()}\n\n"
+        try:
+            yield f"data: {job.get_state()}\n\n"
 
-        while True:
-            try:
-                data = await q.get()
+            async for data in stream_events(subscriber, request):
+                if data is HEARTBEAT:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                # The client fell behind and its backlog was dropped, send the whole state again
+                if data is RESYNC:
+                    yield f"data: {job.get_state()}\n\n"
+                    continue
 
                 if data == "close":
                     yield 'event: close\ndata: {"message": "Stream closed by server"}\n\n'
                     break
 
                 yield f"event: update\ndata: {json.dumps(data)}\n\n"
-            except asyncio.CancelledError:
-                job.remove_client(client_id)
-                raise
+        finally:
+            job.remove_client(client_id)
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
+def encode_cursor(cursor) -> str | None:
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(value, list) or len(value) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+
 @app.get("/api/videos")
-async def get_all_videos():
-    """Return all videos from the database."""
-    all_videos = videos.all()
-    return {"videos": all_videos}
+async def get_all_videos(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    sort: Literal["added", "upload_date", "title", "duration"] = "added",
+    order: Literal["asc", "desc"] = "asc",
+    uploader: str | None = None,
+    status: str | None = None,
+    fields: str | None = None,
+):
+    """Return videos from the database, optionally paginated, sorted, filtered and limited to some fields.
+
+    Without a limit every matching video is returned. With one, `next_cursor` fetches the following page.
+    The ETag changes whenever the library does, so polling clients get a 304 while nothing changed.
+    """
+    etag = f'"{videos.version()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    page, next_cursor = videos.page(
+        sort=sort,
+        descending=order == "desc",
+        limit=limit,
+        after=decode_cursor(cursor) if cursor else None,
+        uploader=uploader,
+        status=status,
+    )
+
+    if fields:
+        # video_id is always included so clients can address the video
+        selected = {"video_id", *(field.strip() for field in fields.split(","))}
+        page = [{key: value for key, value in video.items() if key in selected} for video in page]
+
+    return JSONResponse(
+        {"videos": page, "next_cursor": encode_cursor(next_cursor)},
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
 
 
 @app.get("/api/videos/{video_id}")
 async def get_video_by_id(video_id: str):
     """Return specific video metadata by ID."""
-    q = Query()
-    video_doc = videos.get(q.video_id == video_id)
+    video_doc = videos.get(video_id)
     
     if video_doc:
         return {"video": video_doc}
@@ -190,46 +388,43 @@ async def get_video_by_id(video_id: str):
 @app.delete("/api/videos/{video_id}")
 async def delete_video(video_id: str):
     """Delete a video and all associated files."""
-    q = Query()
-    video_doc = videos.get(q.video_id == video_id)
+    video_doc = videos.get(video_id)
     
     if not video_doc:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Delete associated files
-    download_file = DOWNLOAD_DIR / f"{video_id}.mp3"
-    if download_file.exists():
-        try:
-            download_file.unlink()
-        except Exception:
-            pass  # Continue even if file deletion fails
+    # Delete associated files, whichever format the audio was stored in
+    for ext in AUDIO_EXTENSIONS:
+        download_file = DOWNLOAD_DIR / f"{video_id}.{ext}"
+        if download_file.exists():
+            try:
+                download_file.unlink()
+            except Exception:
+                pass  # Continue even if file deletion fails
     
-    transcript_file = TRANS_DIR / f"{video_id}.json"
-    if transcript_file.exists():
-        try:
-            transcript_file.unlink()
-        except Exception:
-            pass
+    try:
+        remove_transcript(video_id)
+    except Exception:
+        pass
+    indexes.discard(video_id)
+    remove_artifacts(video_id)
+    remove_from_index(video_id)
+    journal.finish(video_id)
     
-    summary_file = SUMMARIES_DIR / f"{video_id}.md"
-    if summary_file.exists():
-        try:
-            summary_file.unlink()
-        except Exception:
-            pass
+    # An interrupted summary leaves its partial file behind
+    for summary_file in (SUMMARIES_DIR / f"{video_id}.md", SUMMARIES_DIR / f"{video_id}.md.part"):
+        if summary_file.exists():
+            try:
+                summary_file.unlink()
+            except Exception:
+                pass
     
     # Remove from database
-    videos.remove(q.video_id == video_id)
+    videos.remove(video_id)
     
     return {"success": True, "message": f"Video {video_id} deleted successfully"}
 
 
-async def restart_server():
-    """Restart the server process after a short delay."""
-    await asyncio.sleep(0.5)  # Allow response to be sent
-    os.execv(sys.executable, [sys.executable] + sys.argv)
-
-
 @app.get("/api/config")
 async def get_config():
     """Get current server configuration."""
@@ -241,8 +436,8 @@ async def get_config():
 
 
 @app.put("/api/config")
-async def update_config(config_update: ConfigUpdate, background_tasks: BackgroundTasks):
-    """Update server configuration."""
+async def update_config(config_update: ConfigUpdate):
+    """Update server configuration. Changes apply to jobs started from now on; running jobs keep their settings."""
     try:
         # Convert to dict and remove None values
         updates = {k: v for k, v in config_update.dict().items() if v is not None}
@@ -250,12 +445,24 @@ async def update_config(config_update: ConfigUpdate, background_tasks: Backgroun
         if not updates:
             raise HTTPException(status_code=400, detail="No configuration updates provided")
         
-        updated_config = config_manager.update_config(updates)
-        
-        # Schedule server restart in background to apply configuration changes
-        background_tasks.add_task(restart_server)
-        
-        return {"success": True, "config": updated_config, "message": "Configuration saved. Server will restart to apply changes."}
+        previous = config_manager.get_config(mask_sensitive=False)
+        updated_config, apply_errors = config_manager.update_config(updates)
+
+        restart_required = sorted(key for key in RESTART_KEYS & updates.keys() if updates[key] != previous[key])
+        if apply_errors:
+            message = f"Configuration saved, but some changes could not be applied: {'; '.join(apply_errors)}"
+        else:
+            message = "Configuration saved and applied."
+        if restart_required:
+            message += f" {', '.join(restart_required)} will apply after the server is restarted."
+
+        return {
+            "success": not apply_errors,
+            "config": updated_config,
+            "restart_required": restart_required,
+            "apply_errors": apply_errors,
+            "message": message,
+        }
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -263,6 +470,22 @@ async def update_config(config_update: ConfigUpdate, background_tasks: Backgroun
         raise HTTPException(status_code=500, detail=f"Failed to update configuration: {str(e)}")
 
 
+@app.post("/api/whisper/warmup")
+async def warm_up_whisper():
+    """Load the configured Whisper model now instead of on the first transcription."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(executor, models.warm_up)
+        return {"success": True, "loaded": [list(key) for key in models.loaded()]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load Whisper model: {str(e)}")
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counts and disk usage of the LLM response cache."""
+    return {"llm_cache": response_cache.stats()}
+
+
 @app.post("/api/config/test")
 async def test_config_connection(request: Request):
     """Test connection with current or specified provider."""
@@ -270,45 +493,162 @@ async def test_config_connection(request: Request):
         data = await request.json()
         provider = data.get("provider")  # Optional, defaults to current provider
         
-        result = config_manager.test_connection(provider)
+        result = await test_connection(provider)
         return {"success": result["success"], **result}
         
     except Exception as e:
         return {"success": False, "error": f"Failed to test connection: {str(e)}"}
 
 
-async def summarize_video(video_id: str):
+def resume_jobs():
+    """Restart the jobs that were interrupted when the server last stopped, with the settings they started with.
+
+    Stages whose output exists are skipped by the stages themselves and summarized chunks are replayed from
+    their checkpoints, so a resumed job picks up where it stopped.
+    """
+    for entry in journal.unfinished():
+        video_id = entry["video_id"]
+        if not claim_job(video_id):
+            continue
+
+        logger.info(f"Resuming job for {video_id} from its {entry['stage']} stage")
+        schedule(summarize_video(video_id, entry["settings"]))
+
+
+async def summarize_video(video_id: str, settings: dict | None = None):
     job = get_job(video_id)
 
     if not job:
         raise Exception("Tried to get a job that doesn't exist") 
 
+    # Settings that shape the whole pipeline are read once, so its stages agree even if the configuration changes
+    settings = settings or {
+        "mode": config.PIPELINE_MODE,
+        "ingest": config.AUDIO_INGEST,
+        "audio_format": config.AUDIO_FORMAT,
+        # How the transcript is cut into chunks, so a resumed job cuts the same chunks and its checkpoints match
+        "chunking": "lines" if config.PIPELINE_MODE == "incremental" else "splitter",
+        "chunk_size": config.MAX_CHUNK_SIZE,
+    }
+    mode, ingest, audio_format = settings["mode"], settings["ingest"], settings["audio_format"]
+    # Jobs journaled before the chunking was recorded were cut by the splitter unless they ran incrementally
+    chunking = settings.get("chunking", "lines" if mode == "incremental" else "splitter")
+    chunk_size = settings.get("chunk_size")
+    journal.start(video_id, settings)
+
     try:
         # Download the video audio
-        await download_video_audio(video_id)
-
-        # Transcribe the audio
-        await transcribe_audio(video_id)
+        async with stage_slot("download", job):
+            await download_video_audio(video_id, ingest, audio_format)
+
+        if mode == "incremental" and not transcript_path(video_id):
+            journal.set_stage(video_id, "transcribe")
+            # Summarize chunks as soon as enough of the transcript exists, while transcription continues.
+            # Each side holds only its own stage's slot, so a busy summarizer never holds up other transcriptions;
+            # segments wait in the feed until a summarize slot frees up.
+            feed = SegmentFeed()
+            stages = [
+                asyncio.create_task(
+                    in_stage_slot("transcribe", job, transcribe_audio(video_id, ingest, audio_format, feed))
+                ),
+                asyncio.create_task(
+                    in_stage_slot(
+                        "summarize", job, summarize_transcript(video_id, feed, chunking, chunk_size), report_wait=False
+                    )
+                ),
+            ]
+            try:
+                await asyncio.gather(*stages)
+            finally:
+                # A failure on either side stops the other, so nothing still runs, or holds a slot, once the job closes
+                for stage in stages:
+                    stage.cancel()
+                await asyncio.gather(*stages, return_exceptions=True)
+        else:
+            # Transcribe the audio
+            journal.set_stage(video_id, "transcribe")
+            async with stage_slot("transcribe", job):
+                await transcribe_audio(video_id, ingest, audio_format)
 
-        # Summarize
-        await summarize_transcript(video_id)
+            # Summarize
+            journal.set_stage(video_id, "summarize")
+            async with stage_slot("summarize", job):
+                await summarize_transcript(video_id, chunking=chunking, chunk_size=chunk_size)
 
+        journal.finish(video_id)
         await job.update_status("success", "Video has been summarized successfully")
+        succeeded = True
     except Exception as e:
+        journal.fail(video_id, str(e))
         await job.broadcast_data(
-            "error", {"error": str(e)}, state_updates={"status": "error"}
+            "error", {"error": str(e)}, state_updates={"status": "error", "error": str(e)}
         )
+        succeeded = False
 
     await close_job(video_id)
+    return succeeded
+
+
+def plan_batch(urls: list[str]) -> tuple[dict[str, str], dict[str, str]]:
+    """Expand the batch's URLs and mark the videos that are already summarized as skipped."""
+    video_ids, errors = expand_urls(urls)
+    statuses = {video_id: "skipped" if summary_path(video_id) else "queued" for video_id in video_ids}
+    return statuses, errors
+
+
+async def run_batch(batch, urls: list[str]):
+    # Jobs claimed for the batch that summarize_video hasn't taken over yet, and so must be closed here
+    unstarted = set()
+
+    try:
+        # Expanding playlists and channels makes network requests, so it runs off the event loop
+        statuses, errors = await asyncio.get_running_loop().run_in_executor(executor, plan_batch, urls)
+        # Jobs are claimed back on the loop, so a video another batch or request is processing is skipped
+        for video_id, status in statuses.items():
+            if status != "queued":
+                continue
+            if claim_job(video_id):
+                unstarted.add(video_id)
+            else:
+                statuses[video_id] = "skipped"
+        await batch.expanded(statuses, errors)
+        logger.info(f"Batch {batch.batch_id} has {len(statuses)} videos, {batch.counts()['queued']} to summarize")
+
+        async def run_video(video_id: str):
+            # summarize_video closes the job however it ends
+            unstarted.discard(video_id)
+            succeeded = await summarize_video(video_id)
+            await batch.update_video(video_id, "done" if succeeded else "failed")
+
+        # Every video is started right away; the stage limits decide how many actually run at once
+        queued = [video_id for video_id, status in statuses.items() if status == "queued"]
+        await asyncio.gather(*(run_video(video_id) for video_id in queued))
+
+        await batch.finish("done")
+    except Exception as e:
+        logger.error(f"Batch {batch.batch_id} failed: {e}")
+        batch.errors["batch"] = str(e)
+        await batch.finish("error")
+    finally:
+        for video_id in unstarted:
+            await close_job(video_id)
+
+    await close_batch_job(batch.batch_id)
 
 
 # Chat endpoints
 @app.get("/api/chat/{video_id}")
-async def get_chat_history(video_id: str):
-    """Get chat history for a video."""
+async def get_chat_history(
+    video_id: str,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: int | None = None,
+):
+    """Get chat history for a video, optionally the last `limit` messages older than message id `before`."""
     try:
-        chat_history = load_chat_history(video_id)
-        return {"messages": chat_history}
+        chat_history = load_chat_history(video_id, limit, before)
+        # Older messages remain when a full page was returned; the client passes next_before to load them
+        next_before = chat_history[0]["id"] if limit is not None and len(chat_history) == limit else None
+        return {"messages": chat_history, "next_before": next_before}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load chat history: {str(e)}")
 
@@ -336,7 +676,7 @@ async def ask_chat_question(video_id: str, request: Request):
 
 
 @app.get("/api/chat/{video_id}/subscribe")
-async def subscribe_to_chat(video_id: str):
+async def subscribe_to_chat(video_id: str, request: Request):
     """Subscribe to chat responses via Server-Sent Events."""
     chat_job = get_chat_job(video_id)
     
@@ -344,15 +684,22 @@ async def subscribe_to_chat(video_id: str):
         # Create chat job if it doesn't exist to allow subscription
         chat_job = create_chat_job(video_id)
     
-    client_id, q = chat_job.add_client()
+    client_id, subscriber = chat_job.add_client()
     
     async def event_stream():
-        # Send current state
-        yield f"data: {chat_job.get_state()}\n\n"
-        
-        while True:
-            try:
-                data = await q.get()
+        try:
+            # Send current state
+            yield f"data: {chat_job.get_state()}\n\n"
+            
+            async for data in stream_events(subscriber, request):
+                if data is HEARTBEAT:
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                # The client fell behind and its backlog was dropped, send the whole state again
+                if data is RESYNC:
+                    yield f"data: {chat_job.get_state()}\n\n"
+                    continue
                 
                 if data == "close":
                     yield 'event: close\ndata: {"message": "Stream closed by server"}\n\n'
@@ -370,9 +717,7 @@ async def subscribe_to_chat(video_id: str):
                 
                 # Regular streaming tokens
                 yield f"event: token\ndata: {json.dumps(data)}\n\n"
-                
-            except asyncio.CancelledError:
-                chat_job.remove_client(client_id)
-                raise
+        finally:
+            chat_job.remove_client(client_id)
     
     return StreamingResponse(event_stream(), media_type="text/event-stream")
@@ -0,0 +1,162 @@
+import gzip
+import json
+import os
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+from .config import ARTIFACTS_DIR, SUMMARIES_DIR
+from .logs import logger
+from .transcripts import transcript_path, load_segments
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+def summary_path(video_id: str) -> Path | None:
+    path = Path(SUMMARIES_DIR) / f"{video_id}.md"
+    return path if path.exists() else None
+
+
+# Where each kind of artifact is read from
+SOURCES = {
+    "summary": summary_path,
+    "transcript": transcript_path,
+}
+
+# Precompressed sidecars, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def artifact_path(kind: str, video_id: str) -> Path:
+    return Path(ARTIFACTS_DIR) / f"{video_id}.{kind}.json"
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def build_artifact(kind: str, video_id: str):
+    """Encode the response body for an artifact once and store it with its compressed sidecars.
+
+    Called whenever the source file is (re)written, so requests only ever send prepared files.
+    """
+    if kind == "summary":
+        with open(summary_path(video_id), "r", encoding="utf-8") as f:
+            body = {"content": f.read()}
+    else:
+        body = {"transcript": load_segments(video_id)}
+
+    data = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    path = artifact_path(kind, video_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Sidecars go first: once the plain file is newer than the source, its sidecars are too
+    _write_atomic(path.with_name(path.name + ".gz"), gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli:
+        _write_atomic(path.with_name(path.name + ".br"), brotli.compress(data, quality=11))
+    else:
+        path.with_name(path.name + ".br").unlink(missing_ok=True)
+    _write_atomic(path, data)
+
+    logger.info(f"Built {kind} artifact for {video_id} ({len(data)} bytes)")
+
+
+def ensure_artifact(kind: str, video_id: str) -> Path | None:
+    """Path of the artifact's prepared response body, rebuilt first if it is missing or older than its source."""
+    source = SOURCES[kind](video_id)
+    path = artifact_path(kind, video_id)
+
+    try:
+        source_mtime = source.stat().st_mtime_ns if source else None
+    except FileNotFoundError:
+        source_mtime = None
+
+    if source_mtime is None:
+        return None
+
+    try:
+        fresh = path.stat().st_mtime_ns >= source_mtime
+    except FileNotFoundError:
+        fresh = False
+
+    if not fresh:
+        build_artifact(kind, video_id)
+    return path
+
+
+def remove_artifacts(video_id: str):
+    for kind in SOURCES:
+        path = artifact_path(kind, video_id)
+        for suffix in ("", *(suffix for _, suffix in ENCODINGS)):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+def _accepted_encodings(request: Request) -> set[str]:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def artifact_response(request: Request, path: Path) -> Response:
+    """Serve a prepared artifact with validators, a precompressed sidecar when the client accepts one, and ranges."""
+    stat = path.stat()
+    headers = {
+        "ETag": f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        # Artifacts change when a video is reprocessed, so clients revalidate instead of caching blindly
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+    if not_modified(request, headers["ETag"], stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    # Ranges address bytes of the plain body, so range requests are always served uncompressed
+    if "range" not in request.headers:
+        accepted = _accepted_encodings(request)
+        for encoding, suffix in ENCODINGS:
+            sidecar = path.with_name(path.name + suffix)
+            if encoding in accepted and sidecar.exists():
+                return FileResponse(
+                    sidecar, media_type="application/json", headers={**headers, "Content-Encoding": encoding}
+                )
+
+    return FileResponse(path, media_type="application/json", headers=headers)
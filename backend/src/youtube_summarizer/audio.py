@@ -0,0 +1,210 @@
+import os
+import subprocess
+import threading
+from collections import deque
+from queue import Queue
+
+import numpy as np
+
+# Whisper works on 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+# Granularity used when looking for a quiet place to cut the audio
+FRAME_SAMPLES = SAMPLE_RATE // 10
+
+# Containers ffmpeg uses when copying a stream's audio untouched, by the extension yt-dlp reports for it
+NATIVE_MUXERS = {"webm": "webm", "m4a": "mp4", "mp4": "mp4", "opus": "ogg", "ogg": "ogg", "mp3": "mp3"}
+
+
+def storage_encoding(audio_format: str, native_ext: str):
+    """The file extension and ffmpeg output arguments used to store audio in the configured format.
+
+    - "native": keep the source's audio stream as is, no transcode
+    - "mono16k": 16 kHz mono Opus, what whisper consumes anyway (roughly 11 MB per hour)
+    - "mp3": 192 kbps MP3
+    """
+    if audio_format == "native":
+        if native_ext in NATIVE_MUXERS:
+            return native_ext, ["-c:a", "copy", "-f", NATIVE_MUXERS[native_ext]]
+        return "mka", ["-c:a", "copy", "-f", "matroska"]
+
+    if audio_format == "mono16k":
+        return "opus", ["-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "libopus", "-b:a", "24k", "-f", "ogg"]
+
+    return "mp3", ["-c:a", "libmp3lame", "-b:a", "192k", "-f", "mp3"]
+
+
+def transcode(source: str, dest: str, args: list[str]):
+    """Encode the audio of `source` into `dest` with ffmpeg output arguments `args` (see storage_encoding).
+
+    Always re-encodes, even when the source already has the target codec. The output is written
+    beside `dest` and renamed once complete, so `dest` may be the source's own path.
+    """
+    partial_path = dest + ".part"
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", source, "-map", "0:a:0", *args, "-y", partial_path]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    if result.returncode != 0:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+
+    os.replace(partial_path, dest)
+
+
+def open_pcm_stream(source: str, persist_path: str, persist_args: list[str], headers: dict | None = None):
+    """Start ffmpeg decoding `source` to 16 kHz mono PCM on stdout while also saving it to `persist_path`.
+
+    `source` is anything ffmpeg can read: a local media file or a remote stream URL. The copy at
+    `persist_path` is written with `persist_args` (see storage_encoding) as audio arrives, so
+    transcription never waits for the download to finish.
+    """
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+
+    if headers:
+        cmd += ["-headers", "".join(f"{key}: {value}\r\n" for key, value in headers.items())]
+
+    cmd += [
+        "-i", source,
+        # Decoded for whisper
+        "-map", "0:a:0", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1",
+        # Persisted for reuse
+        "-map", "0:a:0", *persist_args, "-y", persist_path,
+    ]
+
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+class StderrTail:
+    """Reads a process's stderr on a background thread, keeping only its last lines for error messages.
+
+    Left unread, the pipe fills up once ffmpeg has written enough warnings, and ffmpeg blocks on it.
+    """
+
+    def __init__(self, pipe, lines: int = 20):
+        self._lines: deque[str] = deque(maxlen=lines)
+        self._thread = threading.Thread(target=self._drain, args=(pipe,), daemon=True)
+        self._thread.start()
+
+    def _drain(self, pipe):
+        for line in pipe:
+            self._lines.append(line.decode(errors="replace").rstrip())
+
+    def text(self) -> str:
+        """The last lines written, once the process has exited."""
+        self._thread.join(timeout=5)
+        return "\n".join(self._lines)
+
+
+class DrainedPipe:
+    """Drains a pipe on a background thread so ffmpeg never stalls its download waiting on a slow reader.
+
+    Audio that hasn't been consumed yet is held in memory (16 kHz mono PCM is about 115 MB per hour),
+    up to `max_buffered` bytes. Past that, ffmpeg waits for the reader to catch up.
+    """
+
+    def __init__(self, pipe, read_size: int = 1 << 16, max_buffered: int = 64 << 20):
+        self._chunks: Queue = Queue(max(1, max_buffered // read_size))
+        self._pending = b""
+        self._eof = False
+        self._closed = False
+        threading.Thread(target=self._drain, args=(pipe, read_size), daemon=True).start()
+
+    def _drain(self, pipe, read_size):
+        try:
+            while not self._closed and (chunk := pipe.read1(read_size)):
+                self._chunks.put(chunk)
+        finally:
+            if not self._closed:
+                self._chunks.put(None)
+
+    def close(self):
+        """Stop draining and drop what is buffered, for a reader that gives up before the end."""
+        self._closed = True
+        # Frees the draining thread if it is waiting for room
+        while not self._chunks.empty():
+            self._chunks.get_nowait()
+
+    def read(self, size: int) -> bytes:
+        """Block until `size` bytes are available or the pipe is closed."""
+        parts = [self._pending]
+        available = len(self._pending)
+
+        while available < size and not self._eof:
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+                break
+            parts.append(chunk)
+            available += len(chunk)
+
+        data = b"".join(parts)
+        self._pending = data[size:]
+        return data[:size]
+
+
+def quietest_cut(audio: np.ndarray, search_samples: int) -> int:
+    """Index of the middle of the quietest frame within the last `search_samples` of the audio."""
+    search_samples = min(search_samples, len(audio)) // FRAME_SAMPLES * FRAME_SAMPLES
+    if search_samples == 0:
+        return len(audio)
+
+    tail = audio[len(audio) - search_samples:].reshape(-1, FRAME_SAMPLES)
+    quietest = int(np.argmin(np.sqrt(np.mean(tail ** 2, axis=1))))
+    return len(audio) - search_samples + quietest * FRAME_SAMPLES + FRAME_SAMPLES // 2
+
+
+def iter_pcm_windows(pipe, window_seconds: float, search_seconds: float = 5.0):
+    """Read 16-bit PCM from `pipe` and yield (offset_seconds, audio) windows as they fill up.
+
+    Each window is cut at the quietest point of its last `search_seconds` so words aren't split between
+    windows; whatever follows the cut is carried into the next window. The final window is whatever
+    remains once the stream ends.
+    """
+    window_samples = int(window_seconds * SAMPLE_RATE)
+    search_samples = int(search_seconds * SAMPLE_RATE)
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0
+
+    while True:
+        wanted = window_samples - len(buffer)
+        data = pipe.read(wanted * 2)
+        # Drop a trailing half sample if the stream ended mid-sample
+        data = data[: len(data) // 2 * 2]
+
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+        buffer = np.concatenate([buffer, samples])
+
+        if len(samples) < wanted:
+            if len(buffer):
+                yield offset / SAMPLE_RATE, buffer
+            return
+
+        cut = quietest_cut(buffer, search_samples)
+        yield offset / SAMPLE_RATE, buffer[:cut]
+        offset += cut
+        buffer = buffer[cut:]
+
+
+def split_on_silence(audio: np.ndarray, window_seconds: float, min_silence_ms: int = 500):
+    """Split decoded 16 kHz audio into windows of roughly `window_seconds`, cutting only between speech.
+
+    Speech is located with faster-whisper's Silero VAD. Once a window reaches the target length it is
+    closed in the middle of the next silent gap, so no utterance is split across windows.
+    Returns a list of (start_sample, end_sample) pairs covering the whole audio.
+    """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=min_silence_ms))
+    window_samples = int(window_seconds * SAMPLE_RATE)
+    windows = []
+    window_start = 0
+
+    for current, following in zip(speech, speech[1:]):
+        if current["end"] - window_start >= window_samples:
+            cut = (current["end"] + following["start"]) // 2
+            windows.append((window_start, cut))
+            window_start = cut
+
+    windows.append((window_start, len(audio)))
+    return windows
@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+from . import config
+
+
+class TokenBatcher:
+    """Coalesces streamed LLM tokens into larger pieces before they are broadcast.
+
+    Tokens are buffered until either `interval_ms` has passed since the first buffered token or the
+    buffer reaches `max_bytes`, then handed to `flush` as one string. Call `flush()` before sending
+    any other event so that tokens never arrive after the event that follows them.
+    """
+
+    def __init__(self, flush, interval_ms: int | None = None, max_bytes: int | None = None):
+        self._flush = flush
+        self._interval = (interval_ms or config.TOKEN_FLUSH_INTERVAL_MS) / 1000
+        self._max_bytes = max_bytes or config.TOKEN_FLUSH_BYTES
+        self._parts: list[str] = []
+        self._size = 0
+        self._started = 0.0
+        self._timer: asyncio.Task | None = None
+
+    async def add(self, token: str):
+        if not self._parts:
+            self._started = time.monotonic()
+        self._parts.append(token)
+        self._size += len(token.encode("utf-8"))
+
+        # The elapsed check covers producers that don't yield to the loop often enough for the timer to fire
+        if self._size >= self._max_bytes or time.monotonic() - self._started >= self._interval:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        """Send everything buffered so far immediately."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self._drain()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self._interval)
+        self._timer = None
+        await self._drain()
+
+    async def _drain(self):
+        if not self._parts:
+            return
+
+        # Take the buffer before awaiting so tokens added meanwhile start a new batch
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        await self._flush(text)
@@ -0,0 +1,90 @@
+import asyncio
+import uuid
+import json
+
+from .subscribers import Subscriber
+
+
+# A batch job tracks a list of videos being summarized, and streams their progress to clients as one stream.
+# The videos themselves run as regular summary jobs, which clients can still subscribe to one by one.
+class BatchJob:
+    def __init__(self, batch_id: str):
+        self.batch_id = batch_id
+        self.clients: dict[str, Subscriber] = {}
+        self.status = "expanding"
+        # Status of every video in the batch, in order: queued, skipped, done or failed
+        self.videos: dict[str, str] = {}
+        self.errors: dict[str, str] = {}
+
+    async def broadcast(self, event, control=False):
+        # Offering never waits, so a slow client can't delay the job or the other clients
+        for client_id, client in list(self.clients.items()):
+            if not client.offer(event, control):
+                self.remove_client(client_id)
+
+    def counts(self) -> dict:
+        counts = {"total": len(self.videos), "queued": 0, "skipped": 0, "done": 0, "failed": 0}
+        for status in self.videos.values():
+            counts[status] += 1
+        return counts
+
+    async def expanded(self, statuses: dict[str, str], errors: dict[str, str]):
+        """Set the batch's videos once its URLs have been expanded."""
+        self.videos = statuses
+        self.errors = errors
+        self.status = "running"
+        await self.broadcast({"type": "expanded", "data": json.loads(self.get_state())})
+
+    async def update_video(self, video_id: str, status: str):
+        self.videos[video_id] = status
+        await self.broadcast(
+            {"type": "video_update", "data": {"video_id": video_id, "status": status, "counts": self.counts()}}
+        )
+
+    async def finish(self, status: str = "done"):
+        self.status = status
+        await self.broadcast(
+            {"type": "status_update", "data": {"status": status, "counts": self.counts()}}, control=True
+        )
+
+    def add_client(self):
+        id = str(uuid.uuid4())
+        subscriber = Subscriber()
+        self.clients[id] = subscriber
+        return id, subscriber
+
+    def remove_client(self, client_id):
+        self.clients.pop(client_id, None)
+
+    def get_state(self):
+        return json.dumps({
+            "batch_id": self.batch_id,
+            "status": self.status,
+            "counts": self.counts(),
+            "videos": self.videos,
+            "errors": self.errors,
+        })
+
+    async def close(self):
+        for client in self.clients.values():
+            client.close()
+        await asyncio.sleep(0.01)
+
+
+batches: dict[str, BatchJob] = {}
+
+
+def create_batch_job():
+    new_job = BatchJob(str(uuid.uuid4()))
+    batches[new_job.batch_id] = new_job
+    return new_job
+
+
+async def close_batch_job(batch_id: str):
+    if batch_id in batches:
+        await batches[batch_id].close()
+        del batches[batch_id]
+
+
+def get_batch_job(batch_id: str):
+    return batches.get(batch_id)
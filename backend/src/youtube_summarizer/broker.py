@@ -0,0 +1,317 @@
+import asyncio
+import json
+import time
+import uuid
+
+from . import config
+from .database import db
+from .logs import logger
+from .stages import executor, run_in_stage
+from .summaryjobs import get_job
+
+# Stage tasks queued by the API node for worker nodes, and the messages the workers report back.
+# Both live in the library database, which API and worker nodes share along with the content directory.
+SCHEMA = """
+-- AUTOINCREMENT, so a late message from a replaced worker can never land on a newer task with a reused id.
+-- `worker` names the worker and the attempt: each claim of a task gets its own owner id.
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    error TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, stage, id);
+CREATE TABLE IF NOT EXISTS task_events (
+    id INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_events_task ON task_events (task_id, id);
+"""
+
+db.executescript(SCHEMA)
+
+# How often the API node checks its remote tasks for new messages, and workers check for new tasks
+POLL_SECONDS = 0.1
+
+# Remote tasks the API node keeps in flight at once. Workers apply the stage limits; this only bounds the queue.
+MAX_REMOTE_TASKS = 64
+
+# Running tasks refresh their heartbeat this often; a task without one for STALE_SECONDS is given to another worker
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = 60
+
+
+def submit(stage: str, args: list) -> int:
+    """Queue a stage task and return its id.
+
+    A task of the same stage and arguments that a worker is still running for a previous submitter is taken
+    over instead, so a resumed job doesn't start a second worker on the same files.
+    """
+    encoded = json.dumps(args)
+    with db.transaction() as conn:
+        row = conn.execute(
+            "SELECT id FROM tasks WHERE stage = ? AND args = ? AND status = 'abandoned' ORDER BY id DESC LIMIT 1",
+            (stage, encoded),
+        ).fetchone()
+        if row:
+            conn.execute("UPDATE tasks SET status = 'running' WHERE id = ?", (row["id"],))
+            logger.info(f"Reattached to {stage} task {row['id']}, which a worker is still running")
+            return row["id"]
+
+        return conn.execute("INSERT INTO tasks (stage, args) VALUES (?, ?)", (stage, encoded)).lastrowid
+
+
+def claim(worker: str, stages: list[str]) -> dict | None:
+    """Take the oldest pending task of one of the stages, or None if there is none.
+
+    The task's `owner` identifies this attempt at it; messages, heartbeats and the outcome are only
+    recorded for the current owner.
+    """
+    if not stages:
+        return None
+
+    with db.transaction() as conn:
+        row = conn.execute(
+            f"SELECT id, stage, args FROM tasks WHERE status = 'pending' AND stage IN ({', '.join('?' * len(stages))}) "
+            "ORDER BY id LIMIT 1",
+            stages,
+        ).fetchone()
+        if not row:
+            return None
+
+        owner = f"{worker}/{uuid.uuid4().hex[:8]}"
+        conn.execute(
+            "UPDATE tasks SET status = 'running', worker = ?, heartbeat = ? WHERE id = ?", (owner, time.time(), row["id"])
+        )
+        return {"id": row["id"], "owner": owner, "stage": row["stage"], "args": json.loads(row["args"])}
+
+
+def emit(task_id: int, owner: str, event: dict) -> bool:
+    """Record a message of a task. Returns False if the task no longer belongs to this attempt."""
+    return bool(
+        db.execute(
+            "INSERT INTO task_events (task_id, event) SELECT ?, ? WHERE EXISTS "
+            "(SELECT 1 FROM tasks WHERE id = ? AND worker = ? AND status IN ('running', 'abandoned'))",
+            (task_id, json.dumps(event), task_id, owner),
+        )
+    )
+
+
+def heartbeat(task_id: int, owner: str) -> bool:
+    """Refresh a running task's heartbeat. Returns False if the task no longer belongs to this attempt."""
+    return bool(
+        db.execute(
+            "UPDATE tasks SET heartbeat = ? WHERE id = ? AND worker = ? AND status IN ('running', 'abandoned')",
+            (time.time(), task_id, owner),
+        )
+    )
+
+
+def finish(task_id: int, owner: str, error: str | None = None):
+    """Record the outcome of a task. A task its submitter gave up on is deleted instead."""
+    with db.transaction() as conn:
+        row = conn.execute("SELECT status, worker FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        # The task was requeued after this attempt stopped sending heartbeats, and belongs to another one now
+        if row and row["worker"] != owner:
+            return
+        if not row or row["status"] == "abandoned":
+            _delete(conn, task_id)
+            return
+
+        conn.execute(
+            "UPDATE tasks SET status = ?, error = ? WHERE id = ?", ("failed" if error else "done", error, task_id)
+        )
+
+
+def requeue_stale():
+    """Hand the tasks of workers that stopped sending heartbeats to the next worker that asks.
+
+    The messages of the lost attempt are dropped, since the next one starts the stage over; the API node
+    notices the new owner and resets what it relayed. Stale tasks nobody is waiting for are deleted.
+    """
+    with db.transaction() as conn:
+        stale = conn.execute(
+            "SELECT id, status FROM tasks WHERE status IN ('running', 'abandoned') AND heartbeat < ?",
+            (time.time() - STALE_SECONDS,),
+        ).fetchall()
+
+        for row in stale:
+            if row["status"] == "abandoned":
+                _delete(conn, row["id"])
+            else:
+                conn.execute("DELETE FROM task_events WHERE task_id = ?", (row["id"],))
+                conn.execute("UPDATE tasks SET status = 'pending', worker = NULL WHERE id = ?", (row["id"],))
+
+    if stale:
+        logger.warning(f"Requeued or dropped {len(stale)} tasks of unresponsive workers")
+
+
+def release(task_id: int):
+    """Forget a task once its submitter is done with it. A task still running is deleted when it finishes."""
+    with db.transaction() as conn:
+        row = conn.execute("SELECT status FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row and row["status"] == "running":
+            conn.execute("UPDATE tasks SET status = 'abandoned' WHERE id = ?", (task_id,))
+        else:
+            _delete(conn, task_id)
+
+
+def clear_pending():
+    """Drop the tasks left behind by a previous run of the API node; their jobs are resumed from the journal.
+
+    Tasks a worker is still running are kept along with their messages, for the resumed jobs to take over.
+    """
+    with db.transaction() as conn:
+        conn.execute("UPDATE tasks SET status = 'abandoned' WHERE status = 'running'")
+        conn.execute("DELETE FROM task_events WHERE task_id IN (SELECT id FROM tasks WHERE status != 'abandoned')")
+        conn.execute("DELETE FROM tasks WHERE status != 'abandoned'")
+
+
+def _delete(conn, task_id: int):
+    conn.execute("DELETE FROM task_events WHERE task_id = ?", (task_id,))
+    conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+
+def read_tasks(cursors: dict[int, int]) -> tuple[dict[int, dict], list]:
+    """Read the state of the given tasks and their messages after each task's cursor, as of one moment."""
+    ids = list(cursors)
+    marks = ", ".join("?" * len(ids))
+
+    # One transaction, so the owner read belongs to the same attempt as the messages read with it
+    with db.transaction() as conn:
+        rows = conn.execute(f"SELECT id, status, worker, error FROM tasks WHERE id IN ({marks})", ids).fetchall()
+        events = conn.execute(
+            f"SELECT id, task_id, event FROM task_events WHERE task_id IN ({marks}) AND id > ? ORDER BY id",
+            (*ids, min(cursors.values())),
+        ).fetchall()
+
+    return {row["id"]: dict(row) for row in rows}, events
+
+
+class TaskUpdate:
+    """What one poll found out about a remote task."""
+
+    def __init__(self, row: dict | None, events: list[dict], restarted: bool = False):
+        self.row = row
+        self.events = events
+        self.restarted = restarted
+
+
+class TaskWatch:
+    def __init__(self):
+        self.updates: asyncio.Queue[TaskUpdate] = asyncio.Queue()
+        self.after = 0
+        self.owner = None
+
+
+class TaskRelay:
+    """Polls the broker once for all of this API node's remote tasks and hands each task's messages to its stage.
+
+    The reads run in the stage executor, so the event loop never waits on the database.
+    """
+
+    def __init__(self):
+        self.watches: dict[int, TaskWatch] = {}
+        self._poller: asyncio.Task | None = None
+
+    def watch(self, task_id: int) -> TaskWatch:
+        watch = self.watches[task_id] = TaskWatch()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        return watch
+
+    def unwatch(self, task_id: int):
+        self.watches.pop(task_id, None)
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+
+        while self.watches:
+            cursors = {task_id: watch.after for task_id, watch in self.watches.items()}
+            try:
+                rows, events = await loop.run_in_executor(executor, read_tasks, cursors)
+            except Exception as e:
+                logger.error(f"Failed to poll remote tasks: {e}")
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+
+            by_task = {}
+            for event in events:
+                if event["id"] > cursors[event["task_id"]]:
+                    by_task.setdefault(event["task_id"], []).append(event)
+
+            for task_id in cursors:
+                watch = self.watches.get(task_id)
+                if not watch:
+                    continue
+                row = rows.get(task_id)
+
+                # Another attempt took over: the messages of the lost one were dropped, and the new one starts over
+                if row and watch.owner and row["worker"] != watch.owner:
+                    watch.owner, watch.after = row["worker"], 0
+                    watch.updates.put_nowait(TaskUpdate(row, [], restarted=True))
+                    continue
+
+                if row and row["worker"]:
+                    watch.owner = row["worker"]
+                task_events = by_task.get(task_id, [])
+                if task_events:
+                    watch.after = task_events[-1]["id"]
+                watch.updates.put_nowait(TaskUpdate(row, [json.loads(event["event"]) for event in task_events]))
+
+            await asyncio.sleep(POLL_SECONDS)
+
+
+relay = TaskRelay()
+remote_slots = asyncio.Semaphore(MAX_REMOTE_TASKS)
+
+
+async def run_remote_stage(stage: str, *args):
+    """Queue a stage for a worker node and yield the messages it reports, like `run_in_stage` does for local workers.
+
+    The first argument is the video id. If the task is handed to another worker midway, the video's job drops
+    what the stage produced so far before the new worker's messages arrive. Raises if the worker failed to run
+    the stage.
+    """
+    loop = asyncio.get_running_loop()
+
+    async with remote_slots:
+        task_id = await loop.run_in_executor(executor, submit, stage, list(args))
+        watch = relay.watch(task_id)
+
+        try:
+            while True:
+                update = await watch.updates.get()
+                if update.row is None:
+                    raise RuntimeError(f"{stage} task {task_id} was dropped from the queue")
+
+                if update.restarted:
+                    logger.warning(f"{stage} task {task_id} for {args[0]} was handed to another worker")
+                    job = get_job(args[0])
+                    if job:
+                        await job.restart_stage(stage)
+                    continue
+
+                # The status is read with the messages, so every message sent before the task finished is among them
+                for event in update.events:
+                    yield event
+
+                if update.row["status"] == "failed":
+                    raise RuntimeError(update.row["error"])
+                if update.row["status"] == "done":
+                    break
+        finally:
+            relay.unwatch(task_id)
+            # Not awaited, so the task is released even when the stage is cancelled
+            loop.run_in_executor(executor, release, task_id)
+
+
+def stage_events(stage: str, worker, *args):
+    """Run a blocking stage worker on this node, or queue it for a worker node in remote execution mode."""
+    if config.EXECUTION_MODE == "remote":
+        return run_remote_stage(stage, *args)
+    return run_in_stage(worker, *args)
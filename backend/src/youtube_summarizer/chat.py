@@ -1,22 +1,20 @@
 import os
 import json
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 
-from .config import (
-    CHAT_DIR, 
-    TRANS_DIR,
-    LLM_PROVIDER,
-    DEFAULT_OLLAMA_MODEL,
-    OLLAMA_BASE_URL,
-    OPENROUTER_API_KEY,
-    OPENROUTER_MODEL,
-    OPENROUTER_BASE_URL,
-    OPENROUTER_APP_NAME,
-    OPENROUTER_SITE_URL,
-)
+from . import config
+from .config import CHAT_DIR
 from .logs import logger
 from .chatjobs import get_chat_job
+from .database import chats
+from .llm import LLMClient, get_llm
+from .retrieval import CHARS_PER_TOKEN, indexes
+
+# Chat turns are interactive, so picking their transcript context (loading and querying the index) runs on
+# its own small pool instead of queueing behind downloads and transcriptions on the shared stage executor
+chat_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat")
 
 
 def get_chat_file_path(video_id: str) -> str:
@@ -24,32 +22,140 @@ def get_chat_file_path(video_id: str) -> str:
     return os.path.join(CHAT_DIR, f"{video_id}_chat.json")
 
 
-def load_chat_history(video_id: str) -> List[Dict[str, str]]:
-    """Load chat history for a video."""
-    # Ensure chat directory exists
-    os.makedirs(CHAT_DIR, exist_ok=True)
-    
+def migrate_chat_history(video_id: str):
+    """Move a chat history saved as a JSON file by older versions into the chat store."""
     chat_file = get_chat_file_path(video_id)
-    if os.path.exists(chat_file):
+    if not os.path.exists(chat_file):
+        return
+
+    try:
+        with open(chat_file, 'r', encoding='utf-8') as f:
+            messages = json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError):
+        logger.warning(f"Failed to load chat history for {video_id}, starting fresh")
+        messages = []
+
+    if messages and not chats.count(video_id):
+        chats.append(video_id, messages)
+    os.replace(chat_file, f"{chat_file}.migrated")
+    logger.info(f"Migrated {len(messages)} chat messages of {video_id} to the chat store")
+
+
+def load_chat_history(video_id: str, limit: int | None = None, before: int | None = None) -> List[Dict[str, Any]]:
+    """Load the last `limit` chat messages for a video, older than message id `before`, oldest first."""
+    migrate_chat_history(video_id)
+    return chats.tail(video_id, limit, before)
+
+
+def save_chat_messages(video_id: str, messages: List[Dict[str, str]]):
+    """Append new messages to a video's chat history."""
+    try:
+        chats.append(video_id, messages)
+    except Exception as e:
+        logger.error(f"Failed to save chat history for {video_id}: {e}")
+
+
+def get_chat_summary_file_path(video_id: str) -> str:
+    """Get the file path for the rolling summary of a video's older chat turns."""
+    return os.path.join(CHAT_DIR, f"{video_id}_chat_summary.json")
+
+
+def load_chat_summary(video_id: str) -> Dict[str, Any]:
+    """Load the rolling summary: the first `covered` history messages folded into `summary`."""
+    summary_file = get_chat_summary_file_path(video_id)
+    if os.path.exists(summary_file):
         try:
-            with open(chat_file, 'r', encoding='utf-8') as f:
+            with open(summary_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except (json.JSONDecodeError, FileNotFoundError):
-            logger.warning(f"Failed to load chat history for {video_id}, starting fresh")
-    
-    return []
+            logger.warning(f"Failed to load chat summary for {video_id}, starting fresh")
+
+    return {"covered": 0, "summary": ""}
 
 
-def save_chat_history(video_id: str, messages: List[Dict[str, str]]):
-    """Save chat history for a video."""
+def save_chat_summary(video_id: str, summary: Dict[str, Any]):
+    """Save the rolling summary of a video's older chat turns."""
     os.makedirs(CHAT_DIR, exist_ok=True)
-    chat_file = get_chat_file_path(video_id)
-    
+
     try:
-        with open(chat_file, 'w', encoding='utf-8') as f:
-            json.dump(messages, f, indent=2, ensure_ascii=False)
+        with open(get_chat_summary_file_path(video_id), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
     except Exception as e:
-        logger.error(f"Failed to save chat history for {video_id}: {e}")
+        logger.error(f"Failed to save chat summary for {video_id}: {e}")
+
+
+def estimate_message_tokens(message: Dict[str, str]) -> int:
+    # A few tokens of per-message overhead on top of the content
+    return len(message["content"]) // CHARS_PER_TOKEN + 4
+
+
+def recent_history_start(history: List[Dict[str, str]], budget: int) -> int:
+    """Index of the first message of the most recent whole turns that fit in `budget` estimated tokens."""
+    used = 0
+    start = len(history)
+
+    for i in range(len(history) - 1, -1, -1):
+        used += estimate_message_tokens(history[i])
+        if used > budget:
+            break
+        # Only cut in front of a user message so question and answer stay together
+        if history[i]["role"] == "user":
+            start = i
+
+    return start
+
+
+async def summarize_history(llm: LLMClient, summary: str, messages: List[Dict[str, str]]) -> str:
+    """Fold older chat messages into the rolling summary of the conversation."""
+    conversation = "\n\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    prompt = [
+        {
+            "role": "system",
+            "content": "You maintain a running summary of a conversation between a user and an assistant about a video. "
+            "Update the summary with the new messages. Keep the facts, questions, answers and video timestamps that "
+            "later questions may refer to, drop small talk, and answer with the updated summary only, in under 250 words.",
+        },
+        {
+            "role": "user",
+            "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{conversation}",
+        },
+    ]
+
+    return await llm.complete(prompt, temperature=0.2)
+
+
+async def compact_chat_history(
+    llm: LLMClient, video_id: str, history: List[Dict[str, str]], total: int
+) -> tuple[str, List[Dict[str, str]]]:
+    """Split the conversation into a summary of older turns and the recent turns that fit CHAT_HISTORY_TOKENS.
+
+    `history` is the tail of the conversation, which has `total` messages. The summary is cached and only
+    the messages that fell out of the recent window since the last call are read and folded into it, so
+    each turn costs at most one small summarization request.
+    """
+    offset = total - len(history)
+    start = offset + recent_history_start(history, config.CHAT_HISTORY_TOKENS)
+    rolling = load_chat_summary(video_id)
+
+    # The history was cleared or rewritten since the summary was made
+    if rolling["covered"] > total:
+        rolling = {"covered": 0, "summary": ""}
+
+    if rolling["covered"] < start:
+        try:
+            older = chats.slice(video_id, rolling["covered"], start)
+            rolling = {
+                "covered": start,
+                "summary": await summarize_history(llm, rolling["summary"], older),
+            }
+            save_chat_summary(video_id, rolling)
+            logger.info(f"Folded chat history of {video_id} up to message {start} into its summary")
+        except Exception as e:
+            # Better to lose some old context than to fail the question
+            logger.error(f"Failed to summarize chat history for {video_id}: {e}")
+
+    return rolling["summary"], history[max(start, rolling["covered"]) - offset:]
+
 
 def format_timestamp(
     seconds: float,
@@ -73,28 +179,42 @@ def format_timestamp(
     )
 
 
-def load_video_transcript(video_id: str) -> str:
-    """Load the video transcript to use as context."""
-    transcript_file = os.path.join(TRANS_DIR, f"{video_id}.json")
-    
-    if not os.path.exists(transcript_file):
-        return ""
-    
+def format_window(window: List[Dict[str, Any]]) -> str:
+    return " ".join([format_timestamp(segment['start']) + segment['text'] for segment in window])
+
+
+def load_video_context(video_id: str, query: str) -> str:
+    """Load the parts of the video transcript most relevant to the query, within the chat context budget."""
     try:
-        with open(transcript_file, 'r', encoding='utf-8') as f:
-            transcript_data = json.load(f)
-            # Combine all transcript segments into one text
-            return " ".join([format_timestamp(segment['start']) + segment['text'] for segment in transcript_data])
+        index = indexes.get(video_id)
     except Exception as e:
         logger.error(f"Failed to load transcript for {video_id}: {e}")
         return ""
 
+    if not index:
+        return ""
+
+    windows = index.select(query, config.CHAT_CONTEXT_TOKENS)
+    if len(windows) < len(index.windows):
+        logger.info(f"Using {len(windows)} of {len(index.windows)} transcript windows as chat context for {video_id}")
+
+    # Gaps between non-adjacent windows are marked so the model doesn't read them as continuous speech
+    return "\n...\n".join(format_window(window) for window in windows)
+
 
 async def ask_question(video_id: str, question: str) -> str:
     """Ask a question about the video and stream the response."""
-    # Load chat history and transcript
-    chat_history = load_chat_history(video_id)
-    transcript = load_video_transcript(video_id)
+    llm = get_llm()
+
+    # Load the recent chat history and transcript. Every message counts at least 4 tokens, so this many
+    # messages always cover CHAT_HISTORY_TOKENS and older ones are only read when they get summarized.
+    chat_history = load_chat_history(video_id, limit=config.CHAT_HISTORY_TOKENS // 4 + 1)
+    total_messages = chats.count(video_id)
+    # The previous question is part of the query so follow-ups like "what about the second one?" still match
+    previous_questions = [msg["content"] for msg in chat_history if msg["role"] == "user"][-1:]
+    transcript = await asyncio.get_running_loop().run_in_executor(
+        chat_executor, load_video_context, video_id, " ".join(previous_questions + [question])
+    )
     
     # Create context for the LLM
     context_prompt = f"""You are a helpful assistant that answers questions about YouTube videos based on their transcripts. 
@@ -102,16 +222,24 @@ async def ask_question(video_id: str, question: str) -> str:
 Video Transcript:
 {transcript}
 
+Long transcripts are shortened to the excerpts most relevant to the question, separated by "...".
 Please answer the user's question based on the information in the transcript. If the transcript doesn't contain relevant information, say so politely.
 If you plan on using a video timestamp in your response, format it using [MM:SS] format or [H:MM:SS] format if applicable. The brackets are NECESSARY for later displaying of the timestamp 
 
 Chat History:
 """
     
+    # Older turns are only included as a summary so the prompt stays bounded
+    history_summary, recent_history = await compact_chat_history(llm, video_id, chat_history, total_messages)
+    if history_summary:
+        context_prompt += f"""Summary of the earlier conversation:
+{history_summary}
+"""
+
     # Add chat history to context
     messages = [{"role": "system", "content": context_prompt}]
-    for msg in chat_history:
-        messages.append(msg)
+    for msg in recent_history:
+        messages.append({"role": msg["role"], "content": msg["content"]})
     
     # Add the new user question
     messages.append({"role": "user", "content": question})
@@ -124,18 +252,14 @@ Chat History:
     await chat_job.start_response()
     
     try:
-        # Stream the response based on provider
-        if LLM_PROVIDER == "ollama":
-            response = await _stream_ollama_response(messages, chat_job)
-        elif LLM_PROVIDER == "openrouter":
-            response = await _stream_openrouter_response(messages, chat_job)
-        else:
-            raise Exception(f"Unsupported LLM provider: {LLM_PROVIDER}")
+        # Stream the response from the configured provider
+        response = await _stream_response(llm, messages, chat_job)
         
-        # Save to chat history
-        chat_history.append({"role": "user", "content": question})
-        chat_history.append({"role": "assistant", "content": response})
-        save_chat_history(video_id, chat_history)
+        # Append the turn to the chat history
+        save_chat_messages(video_id, [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": response},
+        ])
         
         await chat_job.finish_response()
         return response
@@ -146,72 +270,17 @@ Chat History:
         raise
 
 
-async def _stream_ollama_response(messages: List[Dict[str, str]], chat_job) -> str:
-    """Stream response from Ollama."""
-    from ollama import chat
-    
-    # Convert messages to Ollama format
-    ollama_messages = []
-    for msg in messages:
-        ollama_messages.append({
-            "role": msg["role"],
-            "content": msg["content"]
-        })
-    
+async def _stream_response(llm: LLMClient, messages: List[Dict[str, str]], chat_job) -> str:
+    """Stream the response from the configured provider to the chat job's clients."""
     full_response = ""
-    
-    try:
-        stream = chat(
-            model=DEFAULT_OLLAMA_MODEL,
-            messages=ollama_messages,
-            stream=True,
-            options={"temperature": 0.7}
-        )
-        
-        for chunk in stream:
-            if 'message' in chunk and 'content' in chunk['message']:
-                token = chunk['message']['content']
-                full_response += token
-                await chat_job.broadcast_data(token)
-        
-        return full_response
-    
-    except Exception as e:
-        logger.error(f"Ollama streaming error: {e}")
-        raise
 
-
-async def _stream_openrouter_response(messages: List[Dict[str, str]], chat_job) -> str:
-    """Stream response from OpenRouter."""
-    from openai import OpenAI
-    
-    client = OpenAI(
-        base_url=OPENROUTER_BASE_URL,
-        api_key=OPENROUTER_API_KEY,
-        default_headers={
-            "HTTP-Referer": OPENROUTER_SITE_URL,
-            "X-Title": OPENROUTER_APP_NAME,
-        }
-    )
-    
-    full_response = ""
-    
     try:
-        stream = client.chat.completions.create(
-            model=OPENROUTER_MODEL,
-            messages=messages,
-            stream=True,
-            temperature=0.7,
-        )
-        
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                token = chunk.choices[0].delta.content
-                full_response += token
-                await chat_job.broadcast_data(token)
-        
+        async for token in llm.stream(messages, temperature=0.7):
+            full_response += token
+            await chat_job.broadcast_data(token)
+
         return full_response
-    
+
     except Exception as e:
-        logger.error(f"OpenRouter streaming error: {e}")
+        logger.error(f"{llm.provider} streaming error: {e}")
         raise
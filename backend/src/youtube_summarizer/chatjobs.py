@@ -2,6 +2,9 @@ import asyncio
 import uuid
 import json
 
+from .batching import TokenBatcher
+from .subscribers import Subscriber
+
 # In the future, I would like to have the Job pattern be more generalized. Instead of having two different job classes with different logic, have one job class class
 # With a single "state" field, and then any change to "state" broadcasts just the change. Then clients read "state" at start, sync up, and then listen to new "state" updated.
 # Simple and clean. However I'm pretty deep into the existing setup so I don't want to do that until a third job manager is required. At 3, its generalization time.
@@ -15,59 +18,67 @@ import json
 class ChatJob:
     def __init__(self, video_id: str):
         self.video_id = video_id
-        self.clients: dict[str, asyncio.Queue] = {}
+        self.clients: dict[str, Subscriber] = {}
         self.turn = 0
         self.text = ""
         self.is_responding = False
+        self.error = None
+        self.batcher = TokenBatcher(self._flush_tokens)
 
-    async def broadcast(self, event, sleep_duration=0.01):
-        for client in self.clients.values():
-            await client.put(event)
-        await asyncio.sleep(sleep_duration)
+    async def broadcast(self, event, control=False):
+        # Offering never waits, so a slow client can't delay the job or the other clients
+        for client_id, client in list(self.clients.items()):
+            if not client.offer(event, control):
+                self.remove_client(client_id)
+
+    async def broadcast_data(self, token: str):
+        """Queue a token to be broadcast with the next batch."""
+        await self.batcher.add(token)
 
-    async def broadcast_data(
-        self,
-        token: str,
-        sleep_duration=0.001,  # Faster for streaming
-    ):
-        self.text += token
-        await self.broadcast(token, sleep_duration)
+    async def _flush_tokens(self, text: str):
+        self.text += text
+        await self.broadcast(text)
 
     async def start_response(self):
         """Start a new response turn."""
         self.is_responding = True
         self.text = ""
+        self.error = None
         self.turn += 1
 
     async def finish_response(self):
         """Mark response as complete."""
+        await self.batcher.flush()
         self.is_responding = False
-        await self.broadcast("__RESPONSE_COMPLETE__")
+        await self.broadcast("__RESPONSE_COMPLETE__", control=True)
 
     async def broadcast_error(self, error_message: str):
         """Broadcast error to all clients."""
+        await self.batcher.flush()
         self.is_responding = False
-        await self.broadcast(f"__ERROR__:{error_message}")
+        self.error = error_message
+        await self.broadcast(f"__ERROR__:{error_message}", control=True)
 
     def add_client(self):
         id = str(uuid.uuid4())
-        new_q = asyncio.Queue()
-        self.clients[id] = new_q
-        return id, new_q
+        subscriber = Subscriber()
+        self.clients[id] = subscriber
+        return id, subscriber
 
     def remove_client(self, client_id):
-        del self.clients[client_id]
+        self.clients.pop(client_id, None)
 
     def get_state(self):
         return json.dumps({
             "text": self.text,
             "turn": self.turn,
-            "is_responding": self.is_responding
+            "is_responding": self.is_responding,
+            "error": self.error,
         })
 
     async def close(self):
         for client in self.clients.values():
-            await client.put("close")
+            client.close()
         await asyncio.sleep(0.01)
 
 
@@ -11,10 +11,18 @@ TRANS_DIR = CONTENT_DIR / "transcriptions"
 DOWNLOAD_DIR = CONTENT_DIR / "downloads"
 SUMMARIES_DIR = CONTENT_DIR / "summaries"
 CHAT_DIR = CONTENT_DIR / "chats"
+DB_PATH = CONTENT_DIR / "library.db"
+# Legacy TinyDB file, imported into DB_PATH on first start
 DB_DIR = CONTENT_DIR / "db.json"
+LLM_CACHE_DIR = CONTENT_DIR / "llm_cache"
+# Response bodies of summaries and transcripts, prepared with compressed copies when their sources are written
+ARTIFACTS_DIR = CONTENT_DIR / "artifacts"
 
 # Import configuration manager for dynamic config
-from .config_manager import config_manager
+from .config_manager import config_manager, DEFAULT_CONFIG
+
+# The settings below are re-read whenever the configuration is updated. Read them as `config.NAME` when a job
+# starts so it runs on the current values; `from .config import NAME` keeps the value from import time.
 
 # Function to get current configuration values
 def get_config_value(key: str):
@@ -25,11 +33,41 @@ def get_config_value(key: str):
 DEFAULT_TRANS_MODEL = get_config_value("WHISPER_MODEL")
 DEFAULT_TRANS_DEVICE = get_config_value("WHISPER_DEVICE")
 DEFAULT_TRANS_COMPUTE_TYPE = get_config_value("WHISPER_COMPUTE_TYPE")
+# 0 lets ctranslate2 pick the thread count
+WHISPER_CPU_THREADS = get_config_value("WHISPER_CPU_THREADS")
+WHISPER_NUM_WORKERS = get_config_value("WHISPER_NUM_WORKERS")
+# Loaded models unused for this long are freed (0 keeps them loaded)
+WHISPER_IDLE_UNLOAD_SECONDS = get_config_value("WHISPER_IDLE_UNLOAD_SECONDS")
+# On CPU, split each file at silences into windows of about this length and transcribe them in this many processes (1 = off)
+TRANSCRIBE_PROCESSES = get_config_value("TRANSCRIBE_PROCESSES")
+TRANSCRIBE_WINDOW_SECONDS = get_config_value("TRANSCRIBE_WINDOW_SECONDS")
+
+# "download" fetches the whole audio file before transcribing, "stream" pipes audio through ffmpeg into whisper as it arrives
+AUDIO_INGEST = get_config_value("AUDIO_INGEST")
+# How downloaded audio is stored: "native" (no transcode), "mono16k" (16 kHz mono Opus) or "mp3"
+AUDIO_FORMAT = get_config_value("AUDIO_FORMAT")
+# Length of the audio windows transcribed while streaming
+STREAM_WINDOW_SECONDS = get_config_value("STREAM_WINDOW_SECONDS")
 
 # Config for LLM provider
 LLM_PROVIDER = get_config_value("LLM_PROVIDER")
+# Requests sent to the LLM provider at once across all jobs and chats; further requests wait for a free slot
+LLM_CONCURRENCY = get_config_value("LLM_CONCURRENCY")
 # Max chunk size for transcript splitting - should be half of the model's max context window
 MAX_CHUNK_SIZE = get_config_value("MAX_CHUNK_SIZE")
+# How many transcript chunks of one video are sent to the LLM provider at once (1 = one after another)
+SUMMARY_PARALLELISM = get_config_value("SUMMARY_PARALLELISM")
+# "sequential" summarizes once transcription has finished, "incremental" summarizes chunks while transcription continues
+PIPELINE_MODE = get_config_value("PIPELINE_MODE")
+
+# Size limit of the on-disk LLM response cache; least recently used responses are evicted past it
+LLM_CACHE_MAX_MB = get_config_value("LLM_CACHE_MAX_MB")
+
+# Chat prompts include at most this many (estimated) transcript tokens, picked in windows of about CHAT_WINDOW_TOKENS
+CHAT_CONTEXT_TOKENS = get_config_value("CHAT_CONTEXT_TOKENS")
+CHAT_WINDOW_TOKENS = get_config_value("CHAT_WINDOW_TOKENS")
+# Recent chat turns are sent verbatim up to this many (estimated) tokens, older ones as a rolling summary
+CHAT_HISTORY_TOKENS = get_config_value("CHAT_HISTORY_TOKENS")
 
 # Ollama configuration
 DEFAULT_OLLAMA_MODEL = get_config_value("OLLAMA_MODEL")
@@ -41,3 +79,44 @@ OPENROUTER_MODEL = get_config_value("OPENROUTER_MODEL")
 OPENROUTER_BASE_URL = get_config_value("OPENROUTER_BASE_URL")
 OPENROUTER_APP_NAME = get_config_value("OPENROUTER_APP_NAME")
 OPENROUTER_SITE_URL = get_config_value("OPENROUTER_SITE_URL")
+
+# Number of shared worker threads that run blocking pipeline stages (download, transcription, summarization)
+STAGE_WORKERS = get_config_value("STAGE_WORKERS")
+
+# Streamed LLM tokens are coalesced into one SSE event per window or once this many bytes are buffered
+TOKEN_FLUSH_INTERVAL_MS = get_config_value("TOKEN_FLUSH_INTERVAL_MS")
+TOKEN_FLUSH_BYTES = get_config_value("TOKEN_FLUSH_BYTES")
+
+# Per-client SSE queue bound, what to do when a client falls that far behind, and the idle interval between keep-alives
+SUBSCRIBER_QUEUE_SIZE = get_config_value("SUBSCRIBER_QUEUE_SIZE")
+SLOW_CONSUMER_POLICY = get_config_value("SLOW_CONSUMER_POLICY")
+SSE_HEARTBEAT_SECONDS = get_config_value("SSE_HEARTBEAT_SECONDS")
+
+# How many videos may be in each pipeline stage at once
+DOWNLOAD_CONCURRENCY = get_config_value("DOWNLOAD_CONCURRENCY")
+TRANSCRIBE_CONCURRENCY = get_config_value("TRANSCRIBE_CONCURRENCY")
+SUMMARIZE_CONCURRENCY = get_config_value("SUMMARIZE_CONCURRENCY")
+
+# "local" runs the pipeline stages in this process, "remote" queues them for worker nodes (`youtube-summarizer worker`)
+EXECUTION_MODE = get_config_value("EXECUTION_MODE")
+
+# Settings whose name here differs from their configuration key
+ALIASES = {
+    "DEFAULT_TRANS_MODEL": "WHISPER_MODEL",
+    "DEFAULT_TRANS_DEVICE": "WHISPER_DEVICE",
+    "DEFAULT_TRANS_COMPUTE_TYPE": "WHISPER_COMPUTE_TYPE",
+    "DEFAULT_OLLAMA_MODEL": "OLLAMA_MODEL",
+}
+
+
+def reload(changed: dict):
+    """Re-read every setting of this module from the config manager."""
+    settings = globals()
+    for name in list(settings):
+        key = ALIASES.get(name, name)
+        if key in DEFAULT_CONFIG:
+            settings[name] = get_config_value(key)
+
+
+# Registered first, so every other listener already sees the new values here
+config_manager.on_change(reload)
@@ -1,7 +1,7 @@
 import json
 import os
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any
 from .logs import logger
 
 # Configuration file path
@@ -12,25 +12,98 @@ DEFAULT_CONFIG = {
     "LLM_PROVIDER": "openrouter",
     "MAX_CHUNK_SIZE": 32000,
     "WHISPER_MODEL": "small.en",
+    "WHISPER_DEVICE": "auto",
     "WHISPER_COMPUTE_TYPE": "int8",
+    "WHISPER_CPU_THREADS": 0,
+    "WHISPER_NUM_WORKERS": 1,
+    "WHISPER_IDLE_UNLOAD_SECONDS": 900,
+    "TRANSCRIBE_PROCESSES": 1,
+    "TRANSCRIBE_WINDOW_SECONDS": 300,
+    "LLM_CACHE_MAX_MB": 512,
+    "CHAT_CONTEXT_TOKENS": 4000,
+    "CHAT_WINDOW_TOKENS": 300,
+    "CHAT_HISTORY_TOKENS": 2000,
+    "LLM_CONCURRENCY": 4,
     "OLLAMA_MODEL": "",
     "OLLAMA_BASE_URL": "",
     "OPENROUTER_MODEL": "qwen/qwen-3-7b-instruct",
     "OPENROUTER_BASE_URL": "https://openrouter.ai/api/v1",
     "OPENROUTER_APP_NAME": "YouTube Summarizer",
     "OPENROUTER_SITE_URL": "https://localhost:3000",
-    "OPENROUTER_API_KEY": ""
+    "OPENROUTER_API_KEY": "",
+    "STAGE_WORKERS": 8,
+    "TOKEN_FLUSH_INTERVAL_MS": 50,
+    "TOKEN_FLUSH_BYTES": 512,
+    "SUBSCRIBER_QUEUE_SIZE": 1000,
+    "SLOW_CONSUMER_POLICY": "snapshot",
+    "SSE_HEARTBEAT_SECONDS": 15,
+    "DOWNLOAD_CONCURRENCY": 3,
+    "TRANSCRIBE_CONCURRENCY": 1,
+    "SUMMARIZE_CONCURRENCY": 2,
+    "SUMMARY_PARALLELISM": 1,
+    "PIPELINE_MODE": "sequential",
+    "AUDIO_INGEST": "download",
+    "AUDIO_FORMAT": "native",
+    "STREAM_WINDOW_SECONDS": 120,
+    "EXECUTION_MODE": "local",
+}
+
+# Keys whose values must be stored as integers
+INTEGER_KEYS = {
+    "MAX_CHUNK_SIZE",
+    "STAGE_WORKERS",
+    "TOKEN_FLUSH_INTERVAL_MS",
+    "TOKEN_FLUSH_BYTES",
+    "SUBSCRIBER_QUEUE_SIZE",
+    "SSE_HEARTBEAT_SECONDS",
+    "DOWNLOAD_CONCURRENCY",
+    "TRANSCRIBE_CONCURRENCY",
+    "SUMMARIZE_CONCURRENCY",
+    "SUMMARY_PARALLELISM",
+    "STREAM_WINDOW_SECONDS",
+    "WHISPER_CPU_THREADS",
+    "WHISPER_NUM_WORKERS",
+    "WHISPER_IDLE_UNLOAD_SECONDS",
+    "TRANSCRIBE_PROCESSES",
+    "TRANSCRIBE_WINDOW_SECONDS",
+    "LLM_CACHE_MAX_MB",
+    "CHAT_CONTEXT_TOKENS",
+    "CHAT_WINDOW_TOKENS",
+    "CHAT_HISTORY_TOKENS",
+    "LLM_CONCURRENCY",
+}
+
+# Smallest value each integer key accepts. Zero is only allowed where it means something: an automatic
+# thread count, never unloading idle models, no LLM cache, no chat history, or unbatched tokens.
+INTEGER_MINIMUMS = {key: 1 for key in INTEGER_KEYS} | {
+    "WHISPER_CPU_THREADS": 0,
+    "WHISPER_IDLE_UNLOAD_SECONDS": 0,
+    "LLM_CACHE_MAX_MB": 0,
+    "CHAT_HISTORY_TOKENS": 0,
+    "TOKEN_FLUSH_INTERVAL_MS": 0,
+    "TOKEN_FLUSH_BYTES": 0,
 }
 
 # Sensitive keys that should be masked in responses
 SENSITIVE_KEYS = {"OPENROUTER_API_KEY"}
 
+# Keys that are only read at startup; changes to them are saved but apply after the next restart
+RESTART_KEYS = {"STAGE_WORKERS"}
+
 
 class ConfigManager:
     def __init__(self):
         self._config = {}
+        self._listeners: list[Callable[[Dict[str, Any]], None]] = []
+        # The environment is rewritten from the configuration after every load, so only the original overrides count
+        self._env = {key: os.environ[key] for key in DEFAULT_CONFIG if key in os.environ}
+        self._file_mtime = None
         self.load_config()
 
+    def on_change(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Call `listener` with the changed keys and their new values after every configuration update."""
+        self._listeners.append(listener)
+
     def load_config(self) -> None:
         """Load configuration from file and environment variables."""
         # Start with defaults
@@ -39,6 +112,7 @@ class ConfigManager:
         # Load from file if it exists
         if CONFIG_FILE.exists():
             try:
+                self._file_mtime = CONFIG_FILE.stat().st_mtime_ns
                 with open(CONFIG_FILE, 'r') as f:
                     file_config = json.load(f)
                     self._config.update(file_config)
@@ -48,10 +122,10 @@ class ConfigManager:
         
         # Override with environment variables (they take precedence)
         for key in DEFAULT_CONFIG.keys():
-            env_value = os.getenv(key)
+            env_value = self._env.get(key)
             if env_value is not None:
                 # Convert numeric values
-                if key == "MAX_CHUNK_SIZE":
+                if key in INTEGER_KEYS:
                     try:
                         self._config[key] = int(env_value)
                     except ValueError:
@@ -59,9 +133,29 @@ class ConfigManager:
                 else:
                     self._config[key] = env_value.lower() if key == "LLM_PROVIDER" else env_value
 
+        # Values below a key's minimum would stall or break the server once applied, so the default is used instead
+        for key in INTEGER_KEYS:
+            if not isinstance(self._config[key], int) or self._config[key] < INTEGER_MINIMUMS[key]:
+                logger.warning(f"{key} must be an integer of at least {INTEGER_MINIMUMS[key]}, using {DEFAULT_CONFIG[key]}")
+                self._config[key] = DEFAULT_CONFIG[key]
+
         # Update environment variables to match loaded config
         self.update_environment_variables()
 
+    def refresh(self) -> None:
+        """Reload the configuration if another process saved the file since it was read, and apply the changes."""
+        try:
+            mtime = CONFIG_FILE.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        if mtime == self._file_mtime:
+            return
+
+        previous = self._config
+        self.load_config()
+        self._notify({key: value for key, value in self._config.items() if previous.get(key) != value})
+
     def save_config(self) -> None:
         """Save configuration to file."""
         try:
@@ -71,6 +165,7 @@ class ConfigManager:
             with open(CONFIG_FILE, 'w') as f:
                 json.dump(self._config, f, indent=2)
                 logger.info(f"Configuration saved to {CONFIG_FILE}")
+            self._file_mtime = CONFIG_FILE.stat().st_mtime_ns
         except IOError as e:
             logger.error(f"Failed to save config file: {e}")
             raise
@@ -91,29 +186,57 @@ class ConfigManager:
         
         return config
 
-    def update_config(self, updates: Dict[str, Any]) -> Dict[str, Any]:
-        """Update configuration with new values."""
+    def update_config(self, updates: Dict[str, Any]) -> tuple[Dict[str, Any], list[str]]:
+        """Validate, save and apply new configuration values.
+
+        Returns the updated configuration and the errors of any change that could not be applied to the
+        running server; those changes are still saved.
+        """
         # Validate updates
         for key, value in updates.items():
             if key not in DEFAULT_CONFIG:
                 raise ValueError(f"Unknown configuration key: {key}")
             
             # Type validation
-            if key == "MAX_CHUNK_SIZE":
+            if key in INTEGER_KEYS:
                 try:
                     updates[key] = int(value)
                 except (ValueError, TypeError):
                     raise ValueError(f"Invalid numeric value for {key}: {value}")
+                if updates[key] < INTEGER_MINIMUMS[key]:
+                    raise ValueError(f"{key} must be at least {INTEGER_MINIMUMS[key]}")
             
             elif key == "LLM_PROVIDER":
                 if value not in ["ollama", "openrouter"]:
                     raise ValueError(f"Invalid LLM provider: {value}")
                 updates[key] = value.lower()
             
+            elif key == "PIPELINE_MODE":
+                if value not in ["sequential", "incremental"]:
+                    raise ValueError(f"Invalid pipeline mode: {value}")
+
+            elif key == "AUDIO_INGEST":
+                if value not in ["download", "stream"]:
+                    raise ValueError(f"Invalid audio ingest mode: {value}")
+
+            elif key == "AUDIO_FORMAT":
+                if value not in ["native", "mono16k", "mp3"]:
+                    raise ValueError(f"Invalid audio format: {value}")
+
+            elif key == "SLOW_CONSUMER_POLICY":
+                if value not in ["drop_oldest", "snapshot", "disconnect"]:
+                    raise ValueError(f"Invalid slow consumer policy: {value}")
+
             elif key == "WHISPER_DEVICE":
-                if value not in ["cpu", "cuda"]:
+                if value not in ["auto", "cpu", "cuda"]:
                     raise ValueError(f"Invalid Whisper device: {value}")
 
+            elif key == "EXECUTION_MODE":
+                if value not in ["local", "remote"]:
+                    raise ValueError(f"Invalid execution mode: {value}")
+
+        changed = {key: value for key, value in updates.items() if self._config.get(key) != value}
+
         # Update configuration
         self._config.update(updates)
         
@@ -122,8 +245,23 @@ class ConfigManager:
         
         # Save to file
         self.save_config()
-        
-        return self.get_config()
+
+        errors = self._notify(changed)
+
+        return self.get_config(), errors
+
+    def _notify(self, changed: Dict[str, Any]) -> list[str]:
+        errors = []
+
+        # Apply the changes to the running server; a listener that fails must not keep the others from running
+        for listener in self._listeners if changed else []:
+            try:
+                listener(changed)
+            except Exception as e:
+                logger.error(f"Failed to apply configuration change: {e}")
+                errors.append(str(e))
+
+        return errors
 
     def update_environment_variables(self) -> None:
         """Update environment variables to match current configuration."""
@@ -131,62 +269,6 @@ class ConfigManager:
             if value is not None:
                 os.environ[key] = str(value)
 
-    def test_connection(self, provider: Optional[str] = None) -> Dict[str, Any]:
-        """Test connection to the specified provider."""
-        test_provider = provider or self._config["LLM_PROVIDER"]
-        result = {"provider": test_provider, "success": False, "error": None}
-        
-        try:
-            if test_provider == "ollama":
-                # Test Ollama connection
-                import requests
-                response = requests.get(f"{self._config['OLLAMA_BASE_URL']}/api/tags", timeout=5)
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    model_names = [model["name"] for model in models]
-                    if self._config["OLLAMA_MODEL"] in model_names:
-                        result["success"] = True
-                        result["message"] = f"Connected to Ollama. Model '{self._config['OLLAMA_MODEL']}' is available."
-                    else:
-                        result["error"] = f"Model '{self._config['OLLAMA_MODEL']}' not found. Available models: {model_names}"
-                else:
-                    result["error"] = f"Ollama server responded with status {response.status_code}"
-                    
-            elif test_provider == "openrouter":
-                # Test OpenRouter connection
-                if not self._config["OPENROUTER_API_KEY"]:
-                    result["error"] = "OpenRouter API key is required"
-                else:
-                    from openai import OpenAI
-                    client = OpenAI(
-                        api_key=self._config["OPENROUTER_API_KEY"],
-                        base_url=self._config["OPENROUTER_BASE_URL"]
-                    )
-                    
-                    # Test with a simple completion
-                    response = client.chat.completions.create(
-                        model=self._config["OPENROUTER_MODEL"],
-                        messages=[{"role": "user", "content": "test"}],
-                        max_tokens=1,
-                        extra_headers={
-                            "HTTP-Referer": self._config["OPENROUTER_SITE_URL"],
-                            "X-Title": self._config["OPENROUTER_APP_NAME"],
-                        }
-                    )
-                    
-                    if response.choices:
-                        result["success"] = True
-                        result["message"] = f"Connected to OpenRouter. Model '{self._config['OPENROUTER_MODEL']}' is available."
-                    else:
-                        result["error"] = "OpenRouter responded but no completion received"
-            else:
-                result["error"] = f"Unknown provider: {test_provider}"
-                
-        except Exception as e:
-            result["error"] = str(e)
-        
-        return result
-
 
 # Global configuration manager instance
 config_manager = ConfigManager()
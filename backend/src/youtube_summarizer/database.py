@@ -1,14 +1,351 @@
-from tinydb import TinyDB
-from .config import DB_DIR
+import json
 import os
+import secrets
+import sqlite3
+import threading
+from contextlib import contextmanager
 
-# Ensure the directory exists before creating the database
-os.makedirs(DB_DIR.parent, exist_ok=True)
+from .config import DB_PATH, DB_DIR
+from .logs import logger
 
-db = TinyDB(DB_DIR)
+# Metadata fields copied into their own columns so they can be indexed, filtered and sorted on
+INDEXED_FIELDS = ("title", "duration", "uploader", "upload_date", "status")
+
+# Sortable columns are stored without NULLs, which keyset comparisons can't order
+SORT_DEFAULTS = {"title": "", "duration": 0, "upload_date": ""}
+
+# Sort orders accepted by VideoStore.page, by the SQL expression each one sorts on. Ties are broken by rowid.
+SORT_KEYS = {
+    "added": "rowid",
+    "upload_date": "upload_date",
+    "title": "title COLLATE NOCASE",
+    "duration": "duration",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    title TEXT,
+    duration REAL,
+    uploader TEXT,
+    upload_date TEXT,
+    status TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS videos_upload_date ON videos (upload_date);
+CREATE INDEX IF NOT EXISTS videos_uploader ON videos (uploader);
+CREATE INDEX IF NOT EXISTS videos_status ON videos (status);
+CREATE INDEX IF NOT EXISTS videos_title ON videos (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS videos_duration ON videos (duration);
+UPDATE videos SET title = IFNULL(title, ''), duration = IFNULL(duration, 0), upload_date = IFNULL(upload_date, '')
+    WHERE title IS NULL OR duration IS NULL OR upload_date IS NULL;
+
+-- Bumped by the triggers below on every change to the library, so readers can tell whether it changed
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('library_version', '0');
+CREATE TRIGGER IF NOT EXISTS videos_inserted AFTER INSERT ON videos BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'library_version';
+END;
+CREATE TRIGGER IF NOT EXISTS videos_updated AFTER UPDATE ON videos BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'library_version';
+END;
+CREATE TRIGGER IF NOT EXISTS videos_deleted AFTER DELETE ON videos BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'library_version';
+END;
+"""
+
+
+class Database:
+    """A single SQLite connection in WAL mode, shared by the event loop and the stage worker threads.
+
+    Statements are serialized with a lock, so callers on any thread can use it directly.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Autocommit; multi-statement writes go through `transaction`
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA busy_timeout=5000")
+
+    def query(self, sql: str, params=()) -> list[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params=()) -> int:
+        """Run one write statement and return the number of rows it changed."""
+        with self.lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def executescript(self, sql: str):
+        with self.lock:
+            self.conn.executescript(sql)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+
+def _columns(doc: dict) -> tuple:
+    values = []
+    for field in INDEXED_FIELDS:
+        value = doc.get(field)
+        values.append(SORT_DEFAULTS.get(field) if value is None and field in SORT_DEFAULTS else value)
+    return (doc["video_id"], *values, json.dumps(doc))
+
+
+class VideoStore:
+    """Video metadata documents keyed by video_id."""
+
+    def __init__(self, db: Database):
+        self.db = db
+        db.executescript(SCHEMA)
+        # Identifies this database in version tags, so a recreated library never matches an old tag
+        db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('library_id', ?)", (secrets.token_hex(4),))
+
+    def version(self) -> str:
+        """Changes whenever any video is added, changed or removed."""
+        rows = self.db.query("SELECT key, value FROM meta WHERE key IN ('library_id', 'library_version')")
+        values = {row["key"]: row["value"] for row in rows}
+        return f"{values['library_id']}-{values['library_version']}"
+
+    def page(
+        self,
+        sort: str = "added",
+        descending: bool = False,
+        limit: int | None = None,
+        after: list | None = None,
+        uploader: str | None = None,
+        status: str | None = None,
+    ) -> tuple[list[dict], list | None]:
+        """One page of videos in the given order, starting after the `after` cursor.
+
+        Returns the page and the cursor of its last video, or None when there are no more videos.
+        Pages are read with a keyset condition on the sort index, so deep pages cost the same as the first.
+        """
+        key = SORT_KEYS[sort]
+        direction = "DESC" if descending else "ASC"
+        conditions = []
+        params = []
+
+        if uploader is not None:
+            conditions.append("uploader = ?")
+            params.append(uploader)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if after is not None:
+            conditions.append(f"({key}, rowid) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+
+        sql = f"SELECT rowid, {key.split()[0]} AS sort_value, data FROM videos"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {key} {direction}, rowid {direction}"
+        if limit is not None:
+            # One extra row tells whether another page follows
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        rows = self.db.query(sql, params)
+        more = limit is not None and len(rows) > limit
+        rows = rows[:limit] if limit is not None else rows
+
+        cursor = [rows[-1]["sort_value"], rows[-1]["rowid"]] if more else None
+        return [json.loads(row["data"]) for row in rows], cursor
+
+    def get(self, video_id: str) -> dict | None:
+        rows = self.db.query("SELECT data FROM videos WHERE video_id = ?", (video_id,))
+        return json.loads(rows[0]["data"]) if rows else None
+
+    def all(self) -> list[dict]:
+        return [json.loads(row["data"]) for row in self.db.query("SELECT data FROM videos ORDER BY rowid")]
+
+    def insert(self, doc: dict):
+        self.db.execute(
+            f"INSERT OR REPLACE INTO videos (video_id, {', '.join(INDEXED_FIELDS)}, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _columns(doc),
+        )
+
+    def update(self, video_id: str, fields: dict):
+        """Merge `fields` into the video's document, if it exists."""
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT data FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+            if not row:
+                return
+
+            doc = {**json.loads(row["data"]), **fields}
+            conn.execute(
+                f"UPDATE videos SET {', '.join(f'{field} = ?' for field in INDEXED_FIELDS)}, data = ? WHERE video_id = ?",
+                (*_columns(doc)[1:], video_id),
+            )
+
+    def remove(self, video_id: str) -> bool:
+        return self.db.execute("DELETE FROM videos WHERE video_id = ?", (video_id,)) > 0
+
+    def migrate_tinydb(self, path):
+        """Import the videos of a legacy TinyDB file once, then rename the file so it isn't imported again."""
+        if not os.path.exists(path):
+            return
+
+        with open(path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+
+        docs = [doc for doc in legacy.get("videos", {}).values() if doc.get("video_id")]
+
+        with self.db.transaction() as conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO videos (video_id, {', '.join(INDEXED_FIELDS)}, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [_columns(doc) for doc in docs],
+            )
+
+        os.replace(path, f"{path}.migrated")
+        logger.info(f"Migrated {len(docs)} videos from {path} to SQLite")
+
+
+CHAT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_messages_video ON chat_messages (video_id, id);
+"""
+
+
+def _message(row: sqlite3.Row) -> dict:
+    return {"id": row["id"], "role": row["role"], "content": row["content"]}
+
+
+class ChatStore:
+    """Append-only chat history per video. Reads go through the (video_id, id) index, newest first when paging."""
+
+    def __init__(self, db: Database):
+        self.db = db
+        db.executescript(CHAT_SCHEMA)
+
+    def append(self, video_id: str, messages: list[dict]):
+        """Append messages in one transaction, so a question is never stored without its answer."""
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO chat_messages (video_id, role, content) VALUES (?, ?, ?)",
+                [(video_id, message["role"], message["content"]) for message in messages],
+            )
+
+    def count(self, video_id: str) -> int:
+        return self.db.query("SELECT COUNT(*) FROM chat_messages WHERE video_id = ?", (video_id,))[0][0]
+
+    def tail(self, video_id: str, limit: int | None = None, before: int | None = None) -> list[dict]:
+        """The last `limit` messages (all of them without a limit) older than message id `before`, oldest first."""
+        sql = "SELECT id, role, content FROM chat_messages WHERE video_id = ?"
+        params = [video_id]
+        if before is not None:
+            sql += " AND id < ?"
+            params.append(before)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return [_message(row) for row in reversed(self.db.query(sql, params))]
+
+    def slice(self, video_id: str, start: int, stop: int) -> list[dict]:
+        """Messages by position in the conversation, from `start` up to `stop`."""
+        rows = self.db.query(
+            "SELECT id, role, content FROM chat_messages WHERE video_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (video_id, max(0, stop - start), start),
+        )
+        return [_message(row) for row in rows]
+
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    video_id TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    video_id TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (video_id, chunk)
+);
+"""
+
+
+class JobJournal:
+    """Persisted record of the pipeline jobs that haven't finished, so they can be resumed after a restart.
+
+    Each job has the settings it started with and the stage it is in. Summarized chunks are checkpointed
+    with a digest of the chunk's text, so a resumed job only sends the chunks that weren't finished yet.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        db.executescript(JOBS_SCHEMA)
+
+    def start(self, video_id: str, settings: dict):
+        """Record a new job. Checkpoints of an earlier, failed run of the same video are kept."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO jobs (video_id, stage, settings) VALUES (?, 'download', ?)",
+            (video_id, json.dumps(settings)),
+        )
+
+    def set_stage(self, video_id: str, stage: str):
+        self.db.execute("UPDATE jobs SET stage = ? WHERE video_id = ?", (stage, video_id))
+
+    def fail(self, video_id: str, error: str):
+        """Failed jobs aren't resumed on startup; submitting the video again reuses their checkpoints."""
+        self.db.execute("UPDATE jobs SET stage = 'failed', error = ? WHERE video_id = ?", (error, video_id))
+
+    def finish(self, video_id: str):
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE video_id = ?", (video_id,))
+            conn.execute("DELETE FROM job_chunks WHERE video_id = ?", (video_id,))
+
+    def unfinished(self) -> list[dict]:
+        """Jobs that were interrupted, in the order they were started."""
+        rows = self.db.query("SELECT video_id, stage, settings FROM jobs WHERE stage != 'failed' ORDER BY rowid")
+        return [{"video_id": row["video_id"], "stage": row["stage"], "settings": json.loads(row["settings"])} for row in rows]
+
+    def save_chunk(self, video_id: str, chunk: int, digest: str, summary: str):
+        self.db.execute(
+            "INSERT OR REPLACE INTO job_chunks (video_id, chunk, digest, summary) VALUES (?, ?, ?, ?)",
+            (video_id, chunk, digest, summary),
+        )
+
+    def chunks(self, video_id: str) -> dict[int, tuple[str, str]]:
+        """Checkpointed chunk summaries by chunk index, with the digest of the chunk they summarize."""
+        rows = self.db.query("SELECT chunk, digest, summary FROM job_chunks WHERE video_id = ?", (video_id,))
+        return {row["chunk"]: (row["digest"], row["summary"]) for row in rows}
+
+
+db = Database(DB_PATH)
 
 # Stores metadata about videos
-videos = db.table("videos")
+videos = VideoStore(db)
+videos.migrate_tinydb(DB_DIR)
+
+# Stores chat messages
+chats = ChatStore(db)
 
-# Stores job transcripts
-jobs = db.table("jobs")
+# Tracks unfinished pipeline jobs
+journal = JobJournal(db)
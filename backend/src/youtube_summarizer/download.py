@@ -1,15 +1,14 @@
 import yt_dlp
-import os
-from tinydb import Query
+from yt_dlp.postprocessor import PostProcessor
 
-from .utils import get_file_path
+from .audio import storage_encoding, transcode
+from .utils import get_file_path, find_audio_file
 from .database import videos
 from .logs import logger
 from .summaryjobs import get_job
+from .broker import stage_events
 
-from queue import Queue, Empty
-import threading
-import asyncio
+import os
 import re
 
 
@@ -25,8 +24,8 @@ def info_to_metadata(info):
     }
 
 
-async def download_video_audio(video_id: str):
-    """Download audio from a YouTube video."""
+async def download_video_audio(video_id: str, ingest: str, audio_format: str):
+    """Download audio from a YouTube video, unless `ingest` is "stream", and store it in `audio_format`."""
 
     # Get job info and filepath
     job = get_job(video_id)
@@ -37,46 +36,59 @@ async def download_video_audio(video_id: str):
     # Update job status to preparing
     await job.update_status("preparing", "Preparing download")
 
-    queue = Queue()
-    t = threading.Thread(target=youtube_dl, args=(queue, video_id), daemon=True)
-    t.start()
-
     largest_progress = 0.0
 
-    while t.is_alive():
-        try:
-            data = queue.get_nowait()
-            if data["type"] == "status_update":
-                await job.update_status(data["status"], data["message"])
-            elif data["type"] == "download_progress":
-                # This if statement is a little weird but it stops backwards progress
-                if data["progress"] > largest_progress:
-                    largest_progress = data["progress"]
-                    await job.broadcast_data(
-                        "download_progress",
-                        {"progress": data["progress"], "message": data["message"]},
-                        state_updates={"download_progress": data["progress"]}
-                    )
-            elif data["type"] == "video_metadata":
+    async for data in stage_events("download", youtube_dl, video_id, ingest, audio_format):
+        if data["type"] == "status_update":
+            await job.update_status(data["status"], data["message"])
+        elif data["type"] == "download_progress":
+            # This if statement is a little weird but it stops backwards progress
+            if data["progress"] > largest_progress:
+                largest_progress = data["progress"]
                 await job.broadcast_data(
-                    "video_metadata",
-                    data["data"],
-                    state_updates={"video": data["data"]}
+                    "download_progress",
+                    {"progress": data["progress"], "message": data["message"]},
+                    state_updates={"download_progress": data["progress"]}
                 )
-        except Empty:
-            pass
-        finally:
-            await asyncio.sleep(0.01)
+        elif data["type"] == "video_metadata":
+            await job.broadcast_data(
+                "video_metadata",
+                data["data"],
+                state_updates={"video": data["data"]}
+            )
 
     # Update job status to downloaded on completion
     await job.update_status("downloaded", "Video download completed")
 
 
-def youtube_dl(queue, video_id):
+class TranscodeAudio(PostProcessor):
+    """Re-encodes the downloaded audio in the configured storage format.
+
+    FFmpegExtractAudio stream-copies when the source already has the wanted codec (YouTube's opus
+    in webm, for mono16k), which skips the downmix, resampling and bitrate. This always encodes.
+    """
+
+    def __init__(self, audio_format: str):
+        super().__init__()
+        self.audio_format = audio_format
+
+    def run(self, info):
+        source = info["filepath"]
+        ext, args = storage_encoding(self.audio_format, info.get("ext", ""))
+        dest = f"{os.path.splitext(source)[0]}.{ext}"
+
+        self.to_screen(f"Encoding audio as {self.audio_format} into {dest}")
+        transcode(source, dest, args)
+
+        info["filepath"], info["ext"] = dest, ext
+        # yt-dlp deletes the files returned here
+        return ([source] if source != dest else []), info
+
+
+def youtube_dl(queue, video_id, ingest, audio_format):
     # Check if the file exists, no need to download if it does just send a download complete message
     path = get_file_path(video_id)
-    q = Query()
-    doc = videos.get(q.video_id == video_id)
+    doc = videos.get(video_id)
     url = f"https://www.youtube.com/watch?v={video_id}"
 
     # Fragment progress tracking
@@ -161,28 +173,25 @@ def youtube_dl(queue, video_id):
                 "progress": 100.0,
                 "message": "Download completed (100%)"
             })
-            queue.put({
-                "type": "status_update",
-                "status": "converting",
-                "message": "Converting video to audio",
-            })
+            if audio_format != "native":
+                queue.put({
+                    "type": "status_update",
+                    "status": "converting",
+                    "message": "Converting video to audio",
+                })
 
     # Set up initial ops
     opts = {
         "format": "bestaudio/best",
         "outtmpl": f"{path}.%(ext)s",
-        "postprocessors": [
-            {
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": "mp3",
-                "preferredquality": "192",
-            }
-        ],
         "progress_hooks": [yt_dlp_hook],
     }
 
-    if not (os.path.exists(path + ".mp3") and doc):
+    if not (find_audio_file(video_id) and doc):
         with yt_dlp.YoutubeDL(opts) as ydl:
+            if audio_format != "native":
+                ydl.add_post_processor(TranscodeAudio(audio_format), when="post_process")
+
             # If the doc doesn't exist, get the metadata and add an entry for it
             if not doc:
                 queue.put(
@@ -202,8 +211,8 @@ def youtube_dl(queue, video_id):
                     "data": new_entry
                 })
 
-            # If the file doesn't exist, download it
-            if not os.path.exists(path + ".mp3"):
+            # If the file doesn't exist, download it. When streaming, transcription fetches the audio itself.
+            if not find_audio_file(video_id) and ingest != "stream":
                 queue.put(
                     {
                         "type": "status_update",
@@ -212,3 +221,14 @@ def youtube_dl(queue, video_id):
                     }
                 )
                 ydl.download([url])
+
+
+def resolve_audio_source(video_id: str):
+    """Look up a direct URL for the video's best audio stream, the HTTP headers needed to fetch it, and its extension."""
+    url = f"https://www.youtube.com/watch?v={video_id}"
+
+    # Prefer a plain HTTP stream; ffmpeg can't reassemble DASH fragments on its own
+    with yt_dlp.YoutubeDL({"format": "bestaudio[protocol=https]/bestaudio/best"}) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    return info["url"], info.get("http_headers", {}), info.get("ext", "webm")
@@ -0,0 +1,212 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from . import config
+from .config_manager import config_manager
+from .logs import logger
+from .scheduler import schedule
+
+# Configuration keys the client is built from; changing any of them replaces the shared client
+CLIENT_KEYS = {
+    "LLM_PROVIDER",
+    "LLM_CONCURRENCY",
+    "OLLAMA_MODEL",
+    "OLLAMA_BASE_URL",
+    "OPENROUTER_API_KEY",
+    "OPENROUTER_MODEL",
+    "OPENROUTER_BASE_URL",
+    "OPENROUTER_APP_NAME",
+    "OPENROUTER_SITE_URL",
+}
+
+
+class LLMClient:
+    """Async access to the configured LLM provider, shared by summarization and chat.
+
+    Each provider gets one async client, created on first use and reused for every request so its
+    keep-alive connection pool is shared. At most `concurrency` requests per provider run at once;
+    further requests wait for a free slot instead of opening more connections.
+
+    The provider settings are read once, when the client is created, so a job that holds a client keeps
+    using the same provider and model even if the configuration changes while it runs. A client replaced
+    by a configuration change is retired: it closes its connections whenever no request is in flight.
+    """
+
+    def __init__(self, provider: str | None = None, concurrency: int | None = None):
+        self.provider = provider or config.LLM_PROVIDER
+        self.concurrency = max(1, concurrency or config.LLM_CONCURRENCY)
+        self.ollama_model = config.DEFAULT_OLLAMA_MODEL
+        self.ollama_base_url = config.OLLAMA_BASE_URL
+        self.openrouter_api_key = config.OPENROUTER_API_KEY
+        self.openrouter_model = config.OPENROUTER_MODEL
+        self.openrouter_base_url = config.OPENROUTER_BASE_URL
+        self.openrouter_app_name = config.OPENROUTER_APP_NAME
+        self.openrouter_site_url = config.OPENROUTER_SITE_URL
+        self._clients = {}
+        # The httpx clients or transports behind the provider clients, which hold the connection pools
+        self._pools = []
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        self._active = 0
+        self._retired = False
+
+    def model(self) -> str:
+        """Name of the model requests are sent to."""
+        return self.openrouter_model if self.provider == "openrouter" else self.ollama_model
+
+    def _pool_limits(self):
+        # httpx comes with both provider SDKs
+        import httpx
+
+        return httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+    def _client(self):
+        if self.provider not in self._clients:
+            if self.provider == "openrouter":
+                if not self.openrouter_api_key:
+                    raise ValueError("OPENROUTER_API_KEY is required when using openrouter provider")
+
+                import httpx
+                from openai import AsyncOpenAI
+
+                http_client = httpx.AsyncClient(limits=self._pool_limits())
+                self._pools.append(http_client)
+                self._clients[self.provider] = AsyncOpenAI(
+                    api_key=self.openrouter_api_key,
+                    base_url=self.openrouter_base_url,
+                    default_headers={
+                        "HTTP-Referer": self.openrouter_site_url,
+                        "X-Title": self.openrouter_app_name,
+                    },
+                    http_client=http_client,
+                )
+            elif self.provider == "ollama":
+                import httpx
+                from ollama import AsyncClient
+
+                # The ollama client has no close method, so it gets a transport this client can close
+                transport = httpx.AsyncHTTPTransport(limits=self._pool_limits())
+                self._pools.append(transport)
+                self._clients[self.provider] = AsyncClient(host=self.ollama_base_url or None, transport=transport)
+            else:
+                raise ValueError(f"Unsupported LLM provider: {self.provider}")
+
+        return self._clients[self.provider]
+
+    def _limit(self) -> asyncio.Semaphore:
+        return self._limits.setdefault(self.provider, asyncio.Semaphore(self.concurrency))
+
+    @asynccontextmanager
+    async def _request(self):
+        """Hold a request slot and yield the provider client. A retired client closes once its last request ends."""
+        self._active += 1
+        try:
+            async with self._limit():
+                yield self._client()
+        finally:
+            self._active -= 1
+            if self._retired and not self._active:
+                await self.aclose()
+
+    async def retire(self):
+        """Close the connections once the requests in flight are done. Later requests still work, on new ones."""
+        self._retired = True
+        if not self._active:
+            await self.aclose()
+
+    async def aclose(self):
+        """Close the connection pools; the next request opens new ones."""
+        pools, self._pools = self._pools, []
+        self._clients = {}
+        for pool in pools:
+            await pool.aclose()
+
+    async def stream(self, messages: list[dict], temperature: float | None = None):
+        """Stream the response to `messages` token by token."""
+        async with self._request() as client:
+            if self.provider == "openrouter":
+                options = {"temperature": temperature} if temperature is not None else {}
+                stream = await client.chat.completions.create(
+                    model=self.model(), messages=messages, stream=True, **options
+                )
+
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            else:
+                options = {"temperature": temperature} if temperature is not None else None
+                stream = await client.chat(model=self.model(), messages=messages, stream=True, options=options)
+
+                async for chunk in stream:
+                    if chunk["message"]["content"]:
+                        yield chunk["message"]["content"]
+
+    async def complete(self, messages: list[dict], temperature: float | None = None) -> str:
+        """Get the complete response to `messages`."""
+        async with self._request() as client:
+            if self.provider == "openrouter":
+                options = {"temperature": temperature} if temperature is not None else {}
+                response = await client.chat.completions.create(model=self.model(), messages=messages, **options)
+                return response.choices[0].message.content or ""
+
+            options = {"temperature": temperature} if temperature is not None else None
+            response = await client.chat(model=self.model(), messages=messages, options=options)
+            return response["message"]["content"]
+
+    async def check(self) -> str:
+        """Make the smallest request that shows the provider serves the model. Raises if it doesn't."""
+        async with self._request() as client:
+            if self.provider == "openrouter":
+                response = await client.chat.completions.create(
+                    model=self.model(), messages=[{"role": "user", "content": "test"}], max_tokens=1
+                )
+                if not response.choices:
+                    raise RuntimeError("OpenRouter responded but no completion received")
+                return f"Connected to OpenRouter. Model '{self.model()}' is available."
+
+            response = await client.list()
+            model_names = [model["model"] for model in response["models"]]
+            if self.model() not in model_names:
+                raise LookupError(f"Model '{self.model()}' not found. Available models: {model_names}")
+            return f"Connected to Ollama. Model '{self.model()}' is available."
+
+
+_llm = LLMClient()
+
+
+def get_llm() -> LLMClient:
+    """The client for the current configuration. Take it once per job and use it for the whole job."""
+    return _llm
+
+
+async def test_connection(provider: str | None = None, timeout: float = 30) -> dict:
+    """Check that a provider (the configured one by default) is reachable with the configured model."""
+    llm = get_llm() if provider in (None, _llm.provider) else LLMClient(provider)
+    result = {"provider": llm.provider, "success": False, "error": None}
+
+    try:
+        async with asyncio.timeout(timeout):
+            result["message"] = await llm.check()
+        result["success"] = True
+    except TimeoutError:
+        result["error"] = f"{llm.provider} did not respond within {timeout:.0f}s"
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        # A client made just for this check isn't shared, so its connections go with it
+        if llm is not _llm:
+            await llm.aclose()
+
+    return result
+
+
+def _reload(changed: dict):
+    global _llm
+
+    if CLIENT_KEYS & changed.keys():
+        # Jobs that already hold the old client finish on it; its connections close when it has no request in flight
+        retired, _llm = _llm, LLMClient()
+        schedule(retired.retire())
+        logger.info(f"LLM client rebuilt for provider {_llm.provider} ({_llm.model()})")
+
+
+config_manager.on_change(_reload)
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+from .config import LLM_CACHE_DIR, LLM_CACHE_MAX_MB
+from .config_manager import config_manager
+from .logs import logger
+
+
+class ResponseCache:
+    """On-disk cache of complete LLM responses, addressed by a hash of everything that shaped them.
+
+    Each response is a file named after its key. Reading an entry touches its mtime, and when the
+    cache grows past `max_bytes` the least recently used entries are deleted first.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Sizes of the entries on disk, read lazily on first use
+        self._sizes: dict[str, int] | None = None
+        self._total = 0
+
+    @staticmethod
+    def key(provider: str, model: str, prompt: str, content: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        digest = hashlib.sha256()
+        for part in (provider, model, prompt_hash, content):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.txt"
+
+    def _index(self) -> dict[str, int]:
+        if self._sizes is None:
+            self._sizes = {}
+            if self.directory.exists():
+                for path in self.directory.glob("*/*.txt"):
+                    self._sizes[path.stem] = path.stat().st_size
+            self._total = sum(self._sizes.values())
+        return self._sizes
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+
+        try:
+            text = path.read_text(encoding="utf-8")
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first so a crash never leaves a truncated entry behind
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            sizes = self._index()
+            self._total += path.stat().st_size - sizes.get(key, 0)
+            sizes[key] = path.stat().st_size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is back under 90% of its limit."""
+        by_age = []
+        for key in self._sizes:
+            try:
+                by_age.append((self._path(key).stat().st_mtime, key))
+            except FileNotFoundError:
+                by_age.append((0.0, key))
+        by_age.sort()
+
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, key in by_age:
+            if self._total <= target:
+                break
+            self._path(key).unlink(missing_ok=True)
+            self._total -= self._sizes.pop(key)
+            removed += 1
+
+        logger.info(f"Evicted {removed} LLM cache entries, {self._total} bytes remain")
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = self._index()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(sizes),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._index()
+            if self._total > self.max_bytes:
+                self._evict()
+
+
+response_cache = ResponseCache(LLM_CACHE_DIR, LLM_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _reload(changed: dict):
+    if "LLM_CACHE_MAX_MB" in changed:
+        response_cache.resize(changed["LLM_CACHE_MAX_MB"] * 1024 * 1024)
+
+
+config_manager.on_change(_reload)
@@ -0,0 +1,125 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+
+from .audio import SAMPLE_RATE, split_on_silence
+
+# This module is imported by the pool's worker processes, so it stays light: no config, database or job imports.
+
+# The model loaded in each worker process
+_model = None
+
+
+def _init_worker(name: str, compute_type: str, cpu_threads: int):
+    global _model
+    from faster_whisper import WhisperModel
+
+    _model = WhisperModel(name, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _transcribe_window(audio, offset: float):
+    """Runs in a worker process. Returns the window's segments with timestamps shifted to absolute time."""
+    segments, _ = _model.transcribe(audio)
+    return [
+        {
+            "start": segment.start + offset,
+            "end": segment.end + offset,
+            "text": segment.text.strip(),
+        }
+        for segment in segments
+    ]
+
+
+class PoolEntry:
+    def __init__(self, executor: ProcessPoolExecutor, key: tuple):
+        self.executor = executor
+        self.key = key
+        self.users = 0
+        self.retired = False
+
+
+class TranscriptionPool:
+    """A pool of processes, each holding its own CPU Whisper model, that transcribe windows of one file in parallel.
+
+    The pool is kept between videos and only replaced when the model, compute type or process count changes.
+    A replaced pool is shut down once the transcriptions still using it are done.
+    """
+
+    def __init__(self):
+        self._current: PoolEntry | None = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def use(self, name: str, compute_type: str, processes: int, cpu_threads: int = 0):
+        """Borrow the process pool for these settings for the duration of the block, starting it if needed."""
+        # Split the cores between the processes unless a thread count was configured
+        cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // processes)
+        key = (name, compute_type, processes, cpu_threads)
+
+        with self._lock:
+            if not self._current or self._current.key != key:
+                if self._current:
+                    self._retire(self._current)
+                # Spawn rather than fork: the parent already runs threads (executor, ctranslate2)
+                executor = ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(name, compute_type, cpu_threads),
+                )
+                self._current = PoolEntry(executor, key)
+            entry = self._current
+            entry.users += 1
+
+        try:
+            yield entry.executor
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.retired and entry.users == 0:
+                    entry.executor.shutdown(wait=False)
+
+    def _retire(self, entry: PoolEntry):
+        entry.retired = True
+        if entry.users == 0:
+            entry.executor.shutdown(wait=False)
+
+
+pool = TranscriptionPool()
+
+
+def transcribe_parallel(path: str, name: str, compute_type: str, processes: int, window_seconds: float, cpu_threads: int = 0):
+    """Transcribe an audio file across `processes` CPU processes, yielding segments in time order.
+
+    The audio is split at silences into windows of about `window_seconds`. About one window per process
+    is in flight at a time, so the pool never holds a pickled copy of the whole file. Results are
+    yielded in order, and the next window is submitted as soon as the oldest one is done.
+    """
+    from faster_whisper import decode_audio
+
+    audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+    windows = iter(split_on_silence(audio, window_seconds))
+    in_flight: deque[Future] = deque()
+
+    with pool.use(name, compute_type, processes, cpu_threads) as executor:
+
+        def submit_next():
+            window = next(windows, None)
+            if window:
+                start, end = window
+                in_flight.append(executor.submit(_transcribe_window, audio[start:end], start / SAMPLE_RATE))
+
+        try:
+            for _ in range(processes):
+                submit_next()
+
+            while in_flight:
+                segments = in_flight.popleft().result()
+                submit_next()
+                yield from segments
+        finally:
+            for future in in_flight:
+                future.cancel()
@@ -0,0 +1,95 @@
+from urllib.parse import parse_qs, urlparse
+
+from .logs import logger
+from .utils import extract_url_id
+
+# Flat extraction lists a playlist's entries from the playlist page alone, without a request per video
+FLAT_OPTIONS = {
+    "extract_flat": "in_playlist",
+    "skip_download": True,
+    "quiet": True,
+    "no_warnings": True,
+}
+
+# Titles YouTube gives playlist entries whose video can't be watched; flat extraction still lists them
+UNAVAILABLE_TITLES = {"[Private video]", "[Deleted video]"}
+
+# Channel pages list their tabs (videos, shorts, live) as nested playlists; deeper nesting isn't followed
+MAX_NESTING = 2
+
+
+def extract_flat(url: str) -> dict:
+    """Fetch the flat yt-dlp info of a playlist or channel URL."""
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL(FLAT_OPTIONS) as ydl:
+        return ydl.extract_info(url, download=False)
+
+
+def playlist_id(url: str) -> str | None:
+    """The playlist a URL points to, including a video URL opened from a playlist (watch?v=...&list=...)."""
+    values = parse_qs(urlparse(url).query).get("list")
+    return values[0] if values else None
+
+
+def is_video_entry(entry: dict) -> bool:
+    if entry.get("ie_key") == "Youtube":
+        return True
+    # Entries without an extractor key are videos if their URL is a video URL
+    return not entry.get("ie_key") and bool(extract_url_id(entry.get("url") or ""))
+
+
+def iter_video_ids(info: dict, extract=extract_flat, depth: int = 0):
+    """Yield the video ids in a flat yt-dlp info dict, following nested playlists through `extract`.
+
+    `extract` is called with the URL of each nested playlist that wasn't expanded in place, so recorded
+    yt-dlp output can stand in for the network.
+    """
+    if info.get("_type") not in ("playlist", "multi_video"):
+        if info.get("id"):
+            yield info["id"]
+        return
+
+    for entry in info.get("entries") or []:
+        # Videos yt-dlp couldn't read show up as empty entries, private and deleted ones by their title
+        if not entry or entry.get("title") in UNAVAILABLE_TITLES:
+            continue
+
+        if entry.get("_type") in ("playlist", "multi_video"):
+            if depth < MAX_NESTING:
+                yield from iter_video_ids(entry, extract, depth + 1)
+        elif is_video_entry(entry):
+            yield entry.get("id") or extract_url_id(entry["url"])
+        elif entry.get("url") and depth < MAX_NESTING:
+            yield from iter_video_ids(extract(entry["url"]), extract, depth + 1)
+
+
+def expand_urls(urls: list[str], extract=extract_flat) -> tuple[list[str], dict[str, str]]:
+    """Turn video, playlist and channel URLs into a list of video ids without duplicates, in order.
+
+    Returns the ids and an error message for each URL that couldn't be expanded.
+    """
+    video_ids = {}
+    errors = {}
+
+    for url in urls:
+        url = url.strip()
+        if not url:
+            continue
+
+        # A video opened from a playlist stands for the whole playlist; single videos need no request at all
+        list_id = playlist_id(url)
+        video_id = extract_url_id(url)
+        if video_id and not list_id:
+            video_ids.setdefault(video_id, None)
+            continue
+
+        source = f"https://www.youtube.com/playlist?list={list_id}" if list_id else url
+        try:
+            for video_id in iter_video_ids(extract(source), extract):
+                video_ids.setdefault(video_id, None)
+        except Exception as e:
+            logger.error(f"Failed to expand {url}: {e}")
+            errors[url] = str(e)
+
+    return list(video_ids), errors
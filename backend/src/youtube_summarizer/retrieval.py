@@ -0,0 +1,167 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from . import config
+from .config_manager import config_manager
+from .transcripts import transcript_path, load_segments
+
+# Rough characters-per-token ratio used to estimate prompt sizes without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Characters a formatted timestamp adds in front of each segment
+TIMESTAMP_CHARS = 8
+
+# How many video indexes are kept in memory
+MAX_CACHED_INDEXES = 32
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+def segment_tokens(segment: dict) -> int:
+    return (len(segment["text"]) + TIMESTAMP_CHARS) // CHARS_PER_TOKEN + 1
+
+
+def build_windows(segments: list[dict], window_tokens: int) -> list[list[dict]]:
+    """Group consecutive segments into windows of about `window_tokens` estimated tokens."""
+    windows = []
+    current = []
+    size = 0
+
+    for segment in segments:
+        current.append(segment)
+        size += segment_tokens(segment)
+        if size >= window_tokens:
+            windows.append(current)
+            current = []
+            size = 0
+
+    if current:
+        windows.append(current)
+    return windows
+
+
+class TranscriptIndex:
+    """BM25 index over windows of consecutive transcript segments."""
+
+    def __init__(self, segments: list[dict], window_tokens: int, k1: float = 1.5, b: float = 0.75):
+        self.windows = build_windows(segments, window_tokens)
+        self.window_sizes = [sum(segment_tokens(segment) for segment in window) for window in self.windows]
+        self.total_tokens = sum(self.window_sizes)
+        self.k1 = k1
+        self.b = b
+
+        self.term_counts = []
+        document_frequency = Counter()
+        for window in self.windows:
+            counts = Counter(tokenize(" ".join(segment["text"] for segment in window)))
+            self.term_counts.append(counts)
+            document_frequency.update(counts.keys())
+
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        # Clamped so windows without any words don't divide by zero
+        self.average_length = max(sum(self.lengths) / max(len(self.lengths), 1), 1)
+        total = len(self.windows)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query: str) -> list[float]:
+        terms = set(tokenize(query)) & self.idf.keys()
+        scores = []
+
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length)
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+
+        return scores
+
+    def select(self, query: str, budget: int) -> list[list[dict]]:
+        """The best matching windows that fit in `budget` estimated tokens, in transcript order.
+
+        When the whole transcript fits the budget every window is returned, so short videos keep full context.
+        Windows that don't match the query at all still fill any budget left, earliest first.
+        """
+        if self.total_tokens <= budget:
+            return self.windows
+
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.windows)), key=lambda i: scores[i], reverse=True)
+        chosen = []
+        used = 0
+
+        for i in ranked:
+            if used + self.window_sizes[i] > budget:
+                continue
+            chosen.append(i)
+            used += self.window_sizes[i]
+
+        return [self.windows[i] for i in sorted(chosen)]
+
+
+class IndexCache:
+    """Keeps the most recently used transcript indexes, rebuilt when the transcript file changes."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_INDEXES):
+        self.max_entries = max_entries
+        self._indexes: OrderedDict[str, tuple[float, TranscriptIndex]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, video_id: str) -> TranscriptIndex | None:
+        path = transcript_path(video_id)
+
+        try:
+            mtime = os.path.getmtime(path) if path else None
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime is None:
+            return None
+
+        with self._lock:
+            cached = self._indexes.get(video_id)
+            if cached and cached[0] == mtime:
+                self._indexes.move_to_end(video_id)
+                return cached[1]
+
+        index = TranscriptIndex(load_segments(video_id), config.CHAT_WINDOW_TOKENS)
+
+        with self._lock:
+            self._indexes[video_id] = (mtime, index)
+            self._indexes.move_to_end(video_id)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+
+        return index
+
+    def discard(self, video_id: str):
+        with self._lock:
+            self._indexes.pop(video_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+indexes = IndexCache()
+
+
+def _reload(changed: dict):
+    # Cached indexes were built with the old window size
+    if "CHAT_WINDOW_TOKENS" in changed:
+        indexes.clear()
+
+
+config_manager.on_change(_reload)
@@ -0,0 +1,68 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from . import config
+from .config_manager import config_manager
+from .logs import logger
+
+# The configuration key that sets each stage's limit
+STAGE_CONCURRENCY_KEYS = {
+    "download": "DOWNLOAD_CONCURRENCY",
+    "transcribe": "TRANSCRIBE_CONCURRENCY",
+    "summarize": "SUMMARIZE_CONCURRENCY",
+}
+
+# Each pipeline stage is bound by a different resource (network, CPU/GPU, LLM provider), so each gets its own limit.
+# A video holds one stage's slot at a time, letting video A summarize while B transcribes and C downloads.
+stage_limits = {
+    stage: asyncio.Semaphore(getattr(config, key)) for stage, key in STAGE_CONCURRENCY_KEYS.items()
+}
+
+# Keeps a reference to every running pipeline so the tasks aren't garbage collected mid-run
+running: set[asyncio.Task] = set()
+
+
+@asynccontextmanager
+async def stage_slot(stage: str, job, report_wait: bool = True):
+    """Hold one of the stage's concurrency slots for the duration of the block.
+
+    With `report_wait`, the job's status says so while it waits for a slot. In remote execution mode
+    the worker nodes apply their own limits, so nothing is held here.
+    """
+    if config.EXECUTION_MODE == "remote":
+        yield
+        return
+
+    limit = stage_limits[stage]
+
+    if limit.locked() and report_wait:
+        await job.update_status("queued", f"Waiting for a free {stage} slot")
+
+    async with limit:
+        logger.info(f"{job.video_id} acquired a {stage} slot")
+        yield
+
+
+async def in_stage_slot(stage: str, job, step, report_wait: bool = True):
+    """Await a pipeline step while holding one of the stage's slots."""
+    async with stage_slot(stage, job, report_wait):
+        return await step
+
+
+def _reload(changed: dict):
+    for stage, key in STAGE_CONCURRENCY_KEYS.items():
+        if key in changed:
+            # New videos queue on the new limit; videos holding or waiting for a slot of the old one keep it
+            stage_limits[stage] = asyncio.Semaphore(changed[key])
+            logger.info(f"{stage} concurrency set to {changed[key]}")
+
+
+config_manager.on_change(_reload)
+
+
+def schedule(pipeline):
+    """Start a pipeline coroutine in the background and track it until it finishes."""
+    task = asyncio.create_task(pipeline)
+    running.add(task)
+    task.add_done_callback(running.discard)
+    return task
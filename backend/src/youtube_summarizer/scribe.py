@@ -1,36 +1,21 @@
-from faster_whisper import WhisperModel, format_timestamp
-from tinydb import Query
 import time
 import os
-import json
-import threading
-import asyncio
-import ctranslate2
-from queue import Queue, Empty
-
-from .config import (
-    DEFAULT_TRANS_COMPUTE_TYPE,
-    DEFAULT_TRANS_MODEL,
-    TRANS_DIR,
-)
+
+from . import config
 
 from .logs import logger
 
-from .utils import get_file_path
+from .utils import get_file_path, find_audio_file
 from .database import videos
+from .artifacts import build_artifact
+from .search import index_transcript
+from .transcripts import transcript_file, write_transcript
 from .summaryjobs import get_job
-
-from faster_whisper import format_timestamp
-
-# Use cuda by default, cpu otherwise
-device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
-print(f"For transcriptionm, using {device}")
-
-model = WhisperModel(
-    DEFAULT_TRANS_MODEL,
-    device=device,
-    compute_type="float32"
-)
+from .broker import stage_events
+from .download import resolve_audio_source
+from .audio import SAMPLE_RATE, DrainedPipe, StderrTail, open_pcm_stream, iter_pcm_windows, storage_encoding
+from .whisper_models import models
+from .parallel_transcribe import transcribe_parallel
 
 def format_timestamp(
     seconds: float,
@@ -54,54 +39,109 @@ def format_timestamp(
     )
 
 
-async def transcribe_audio(video_id: str):
-    """Transcribe audio file to text and save segments to database."""
+async def transcribe_audio(video_id: str, ingest: str, audio_format: str, feed=None):
+    """Transcribe audio file to text and save segments to database.
+
+    Without a downloaded file, audio is streamed when `ingest` is "stream" and saved in `audio_format`.
+    If a segment feed is given, every segment is also passed to it so summarization can start early.
+    """
     job = get_job(video_id)
 
     if not job:
         raise ValueError("Invalid job id")
 
-    # Create queue and start worker thread
-    queue = Queue()
-    t = threading.Thread(target=transcribe_worker, args=(queue, video_id), daemon=True)
-    t.start()
+    error = None
 
-    # Process messages from worker thread
-    while t.is_alive():
-        try:
-            data = queue.get_nowait()
+    try:
+        # Process messages from the worker as they arrive
+        async for data in stage_events("transcribe", transcribe_worker, video_id, ingest, audio_format):
             if data["type"] == "status_update":
                 await job.update_status(data["status"], data["message"])
             elif data["type"] == "transcript_segment":
-                segment_data = data["data"]
                 # Add to transcript buffer and broadcast segment
-                await job.broadcast_data(
-                    "transcript_segment",
-                    segment_data,
-                    state_updates={"transcript_buffer": job.job_state["transcript_buffer"] + [segment_data]}
-                )
+                await job.append_transcript_segment(data["data"])
+                if feed:
+                    feed.put(data["data"])
             elif data["type"] == "error":
                 logger.error(f"Transcription error: {data['message']}")
-                await job.update_status("error", data["message"])
-                break
-        except Empty:
-            pass
-        finally:
-            await asyncio.sleep(0.01)
+                # Raised so the job is recorded as failed instead of carrying on without a transcript
+                raise RuntimeError(data["message"])
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if feed:
+            feed.finish(error)
 
     # Update job status to transcribed on completion
     await job.update_status("transcribed", "Audio transcription completed")
 
 
+def to_segment_data(segment, offset: float = 0.0):
+    return {
+        "start": segment.start + offset,
+        "end": segment.end + offset,
+        "text": segment.text.strip(),
+    }
+
+
+def transcribe_file(path: str):
+    """Transcribe a finished audio file, yielding segments as they are decoded."""
+    name, device, compute_type = models.key()
+    processes = config.TRANSCRIBE_PROCESSES
+
+    # On CPU hosts a single model can't use every core, so long files are split across processes
+    if processes > 1 and device == "cpu":
+        logger.info(f"Transcribing {path} across {processes} processes")
+        yield from transcribe_parallel(
+            path, name, compute_type, processes, config.TRANSCRIBE_WINDOW_SECONDS, config.WHISPER_CPU_THREADS
+        )
+        return
 
+    with models.use() as model:
+        segments, _ = model.transcribe(path)
+        for segment in segments:
+            yield to_segment_data(segment)
 
 
+def transcribe_stream(source: str, persist_path: str, persist_args: list[str], headers: dict | None = None):
+    """Transcribe audio while it is still arriving, yielding segments with absolute timestamps.
 
-def transcribe_worker(queue, video_id):
+    `source` is decoded by ffmpeg straight to 16 kHz mono PCM, which is transcribed window by window.
+    It can be a remote stream URL or a local media file. The audio is saved to `persist_path` along
+    the way so later runs can reuse it.
+    """
+    partial_path = persist_path + ".part"
+    process = open_pcm_stream(source, partial_path, persist_args, headers)
+    errors = StderrTail(process.stderr)
+    pcm = DrainedPipe(process.stdout)
+
+    try:
+        with models.use() as model:
+            for offset, window in iter_pcm_windows(pcm, config.STREAM_WINDOW_SECONDS):
+                logger.info(f"Transcribing streamed window at {offset:.1f}s ({len(window) / SAMPLE_RATE:.1f}s long)")
+                segments, _ = model.transcribe(window)
+                for segment in segments:
+                    yield to_segment_data(segment, offset)
+
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {errors.text()}")
+
+        # Only publish the saved audio once it is complete, so a partial file is never mistaken for a download
+        os.replace(partial_path, persist_path)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        pcm.close()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def transcribe_worker(queue, video_id, ingest, audio_format):
     """Worker function that runs in separate thread to do heavy transcription compute."""
     try:
-        q = Query()
-        doc = videos.get(q.video_id == video_id)
+        doc = videos.get(video_id)
 
         if doc and doc.get("status") == "done":
             logger.info(f"{video_id} has already been transcribed. Skipping operation")
@@ -120,23 +160,24 @@ def transcribe_worker(queue, video_id):
             "message": "Starting audio transcription"
         })
 
-        path = get_file_path(video_id) + ".mp3"
+        path = find_audio_file(video_id)
         complete_text = ""
         segments_data = []
 
-        segments, _ = model.transcribe(path)
+        if path:
+            segments = transcribe_file(path)
+        elif ingest == "stream":
+            source, headers, native_ext = resolve_audio_source(video_id)
+            ext, persist_args = storage_encoding(audio_format, native_ext)
+            segments = transcribe_stream(source, f"{get_file_path(video_id)}.{ext}", persist_args, headers)
+        else:
+            raise FileNotFoundError(f"No downloaded audio for {video_id}")
+
         start = time.time()
 
         # Process each segment and send to queue
-        for segment in segments:
-            segment_text = segment.text.strip()
-            logger.info(f"[{segment.start}] - [{segment.end}]: {segment_text}")
-
-            segment_data = {
-                "start": segment.start,
-                "end": segment.end,
-                "text": segment_text,
-            }
+        for segment_data in segments:
+            logger.info(f"[{segment_data['start']}] - [{segment_data['end']}]: {segment_data['text']}")
 
             segments_data.append(segment_data)
 
@@ -146,21 +187,18 @@ def transcribe_worker(queue, video_id):
                 "data": segment_data
             })
 
-            complete_text += segment_text
+            complete_text += segment_data["text"]
 
-        # Write the timestamped transcription to a JSON file
-        json_filepath = f"{TRANS_DIR}/{video_id}.json"
-        os.makedirs(os.path.dirname(json_filepath), exist_ok=True)
-        with open(json_filepath, "w") as f:
-            json.dump(segments_data, f, indent=2)
+        # Write the timestamped transcription in the packed transcript format
+        transcript_filepath = str(transcript_file(video_id))
+        write_transcript(transcript_filepath, segments_data)
+        build_artifact("transcript", video_id)
+        index_transcript(video_id, segments_data)
 
         # Update metadata to reflect completed operation
         end = time.time()
 
-        videos.update(
-            {"status": "done", "transcript_filepath": json_filepath},
-            q.video_id == video_id,
-        )
+        videos.update(video_id, {"status": "done", "transcript_filepath": transcript_filepath})
 
         queue.put({
             "type": "status_update",
@@ -0,0 +1,119 @@
+import re
+
+from .config import SUMMARIES_DIR
+from .database import db, videos
+from .logs import logger
+from .transcripts import load_segments
+
+# Indexed text lives in search_docs; search_index is an FTS5 index over it, kept in sync by the triggers.
+# Deleting a video's documents goes through the video_id index instead of scanning the full-text table.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    rowid INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS search_docs_video ON search_docs (video_id, kind);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    text,
+    kind,
+    content='search_docs',
+    content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS search_docs_inserted AFTER INSERT ON search_docs BEGIN
+    INSERT INTO search_index (rowid, text, kind) VALUES (new.rowid, new.text, new.kind);
+END;
+CREATE TRIGGER IF NOT EXISTS search_docs_deleted AFTER DELETE ON search_docs BEGIN
+    INSERT INTO search_index (search_index, rowid, text, kind) VALUES ('delete', old.rowid, old.text, old.kind);
+END;
+"""
+
+db.executescript(SCHEMA)
+
+SEARCH_TERM = re.compile(r"\w+")
+
+
+def _replace_documents(video_id: str, kind: str, rows: list[tuple[float | None, str]]):
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM search_docs WHERE video_id = ? AND kind = ?", (video_id, kind))
+        conn.executemany(
+            "INSERT INTO search_docs (video_id, kind, start, text) VALUES (?, ?, ?, ?)",
+            [(video_id, kind, start, text) for start, text in rows if text.strip()],
+        )
+
+
+def index_transcript(video_id: str, segments: list[dict]):
+    """Replace the video's transcript in the search index, one document per segment."""
+    _replace_documents(video_id, "transcript", [(segment["start"], segment["text"]) for segment in segments])
+
+
+def index_summary(video_id: str, summary: str):
+    """Replace the video's summary in the search index, one document per paragraph."""
+    _replace_documents(video_id, "summary", [(None, paragraph) for paragraph in re.split(r"\n\s*\n", summary)])
+
+
+def remove_from_index(video_id: str):
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM search_docs WHERE video_id = ?", (video_id,))
+
+
+def to_match_query(text: str, kind: str | None = None) -> str | None:
+    """Turn free text into an FTS5 query matching documents that contain every word, the last one as a prefix."""
+    terms = SEARCH_TERM.findall(text)
+    if not terms:
+        return None
+
+    words = " ".join([*(f'"{term}"' for term in terms[:-1]), f'"{terms[-1]}"*'])
+    match = f"text : ({words})"
+    return f'kind : "{kind}" AND {match}' if kind else match
+
+
+def search(text: str, kind: str | None = None, limit: int = 20, offset: int = 0) -> list[dict]:
+    """Best matching transcript segments and summary paragraphs across the library, ranked by BM25."""
+    match = to_match_query(text, kind)
+    if not match:
+        return []
+
+    # Ranking runs on the full-text index alone; only the page of hits is joined and given a snippet
+    sql = """
+        SELECT d.video_id, d.kind, d.start, v.title,
+               snippet(search_index, 0, '<mark>', '</mark>', '…', 16) AS snippet
+        FROM (
+            SELECT rowid, rank FROM search_index WHERE search_index MATCH ? ORDER BY rank LIMIT ? OFFSET ?
+        ) AS hits
+        JOIN search_index ON search_index.rowid = hits.rowid AND search_index MATCH ?
+        JOIN search_docs d ON d.rowid = hits.rowid
+        LEFT JOIN videos v ON v.video_id = d.video_id
+        ORDER BY hits.rank
+    """
+    params = [match, limit, offset, match]
+    return [dict(row) for row in db.query(sql, params)]
+
+
+def backfill():
+    """Index the transcripts and summaries of videos processed before search existed."""
+    indexed = {(row["video_id"], row["kind"]) for row in db.query("SELECT DISTINCT video_id, kind FROM search_docs")}
+    count = 0
+
+    for video in videos.all():
+        video_id = video["video_id"]
+
+        try:
+            if (video_id, "transcript") not in indexed:
+                segments = load_segments(video_id)
+                if segments:
+                    index_transcript(video_id, segments)
+                    count += 1
+
+            summary_file = SUMMARIES_DIR / f"{video_id}.md"
+            if (video_id, "summary") not in indexed and summary_file.exists():
+                index_summary(video_id, summary_file.read_text(encoding="utf-8"))
+                count += 1
+        except Exception as e:
+            logger.error(f"Failed to index {video_id} for search: {e}")
+
+    if count:
+        logger.info(f"Indexed {count} existing transcripts and summaries for search")
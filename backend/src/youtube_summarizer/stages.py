@@ -0,0 +1,70 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import STAGE_WORKERS
+
+# One pool of worker threads shared by every job. Blocking stage workers (yt-dlp, whisper, file IO)
+# run here instead of each job spawning its own thread.
+executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+
+# Marks the end of a worker's message stream
+_DONE = object()
+
+
+class StageCancelled(Exception):
+    """Raised in a worker thread when nobody reads its messages anymore, so it stops instead of running on."""
+
+
+class LoopQueue:
+    """Thread-safe handle that worker threads use to hand messages to the event loop.
+
+    Exposes the same `put` method as `queue.Queue`, so workers don't need to know they are
+    feeding an asyncio queue. Each put schedules the item on the loop, which wakes the awaiting
+    consumer immediately instead of waiting for a poll.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self._loop = loop
+        self._queue = queue
+        self.cancelled = False
+
+    def put(self, item):
+        if self.cancelled:
+            raise StageCancelled("The stage was stopped")
+        self._send(item)
+
+    def _send(self, item):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+
+def _run_worker(worker, queue: LoopQueue, args):
+    try:
+        worker(queue, *args)
+    except StageCancelled:
+        pass
+    finally:
+        queue._send(_DONE)
+
+
+async def run_in_stage(worker, *args):
+    """Run a blocking worker on the shared executor and yield the messages it emits.
+
+    The worker is called as `worker(queue, *args)` and reports progress with `queue.put(message)`.
+    Iteration ends once the worker returns; any exception it raised is re-raised here. If the consumer
+    stops early (it failed or was cancelled), the worker's next `put` raises StageCancelled.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    handle = LoopQueue(loop, queue)
+    future = loop.run_in_executor(executor, _run_worker, worker, handle, args)
+
+    try:
+        while True:
+            data = await queue.get()
+            if data is _DONE:
+                break
+            yield data
+
+        await future
+    finally:
+        handle.cancelled = True
@@ -0,0 +1,159 @@
+import asyncio
+
+from starlette.requests import Request
+
+from . import config
+from .logs import logger
+
+# Queued in place of dropped events when a subscriber falls behind under the "snapshot" policy.
+# The stream answers it by sending the job's full current state again.
+RESYNC = object()
+
+# Yielded by stream_events when nothing happened for a heartbeat interval
+HEARTBEAT = object()
+
+
+class _Control:
+    """A queued control event, which overflow handling never discards."""
+
+    __slots__ = ("event",)
+
+    def __init__(self, event):
+        self.event = event
+
+
+class Subscriber:
+    """A single SSE client's bounded event queue.
+
+    `offer` never blocks, so a slow client can't hold up the job or the other clients. When the
+    queue is full the policy decides what gives:
+    - "drop_oldest": discard the oldest queued data event
+    - "snapshot": discard the queued data events and resend the full state once the client catches up
+    - "disconnect": close the client's stream
+
+    Control events (a job or chat turn ending, or failing) are never discarded, because a state
+    snapshot can't stand in for them. Queued data events make room for them instead.
+    """
+
+    def __init__(self, maxsize: int | None = None, policy: str | None = None):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize or config.SUBSCRIBER_QUEUE_SIZE)
+        self.policy = policy or config.SLOW_CONSUMER_POLICY
+        self.closed = False
+        self.resync_pending = False
+
+    def offer(self, event, control: bool = False) -> bool:
+        """Queue an event without waiting. Returns False once the subscriber should be dropped."""
+        if self.closed:
+            return False
+
+        # Data up to the resync is covered by the snapshot the client is about to get
+        if self.resync_pending and not control:
+            return True
+
+        item = _Control(event) if control else event
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == "drop_oldest":
+            if self._discard_data(oldest_only=True):
+                self.queue.put_nowait(item)
+                return True
+        elif self.policy == "snapshot" or control:
+            self._discard_data()
+            needed = (not self.resync_pending) + control
+            if self.queue.maxsize - self.queue.qsize() >= needed:
+                if not self.resync_pending:
+                    self.resync_pending = True
+                    self.queue.put_nowait(RESYNC)
+                if control:
+                    self.queue.put_nowait(item)
+                return True
+
+        # Disconnect by policy, or because the queue holds nothing but control events
+        logger.warning("Disconnecting slow SSE subscriber")
+        self._discard_data()
+        self.close()
+        return False
+
+    def resync(self) -> bool:
+        """Replace the queued data events with a resend of the full state. Returns False if there was no room."""
+        if self.closed:
+            return False
+
+        self._discard_data()
+        if not self.resync_pending:
+            if self.queue.full():
+                logger.warning("Disconnecting slow SSE subscriber")
+                self.close()
+                return False
+            self.resync_pending = True
+            self.queue.put_nowait(RESYNC)
+        return True
+
+    def close(self):
+        """Tell the stream to end once the client has read the control events already queued.
+
+        If the queue is full, its oldest data event makes room for the close. A queue holding only control
+        events keeps them all; `get` reports the close once they are read.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        if self.queue.full():
+            self._discard_data(oldest_only=True)
+        if not self.queue.full():
+            self.queue.put_nowait("close")
+
+    async def get(self):
+        if self.closed and self.queue.empty():
+            return "close"
+        event = await self.queue.get()
+        if event is RESYNC:
+            self.resync_pending = False
+        if isinstance(event, _Control):
+            return event.event
+        return event
+
+    def _discard_data(self, oldest_only: bool = False) -> bool:
+        """Remove the queued data events, or only the oldest one, keeping the rest in order."""
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+
+        discarded = False
+        for item in items:
+            if item is RESYNC or isinstance(item, _Control) or (oldest_only and discarded):
+                self.queue.put_nowait(item)
+            else:
+                discarded = True
+        return discarded
+
+
+async def stream_events(subscriber: Subscriber, request: Request, heartbeat: float | None = None):
+    """Yield a subscriber's events until it is closed or the client goes away.
+
+    Yields HEARTBEAT when the stream has been idle for `heartbeat` seconds, which is also when the
+    connection is checked so abandoned clients are noticed even if the job is quiet.
+    When RESYNC is yielded, the caller must read the job state before awaiting anything else.
+    """
+    heartbeat = heartbeat or config.SSE_HEARTBEAT_SECONDS
+
+    while True:
+        try:
+            # asyncio.timeout keeps the get in this task, so nothing can run between it returning RESYNC and the caller reading state
+            async with asyncio.timeout(heartbeat):
+                event = await subscriber.get()
+        except TimeoutError:
+            if await request.is_disconnected():
+                return
+            yield HEARTBEAT
+            continue
+
+        yield event
+
+        if event == "close":
+            return
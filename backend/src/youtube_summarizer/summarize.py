@@ -1,31 +1,31 @@
-from .config import (
-    MAX_CHUNK_SIZE,
-    TRANS_DIR,
-    SUMMARIES_DIR,
-    LLM_PROVIDER,
-    DEFAULT_OLLAMA_MODEL,
-    OLLAMA_BASE_URL,
-    OPENROUTER_API_KEY,
-    OPENROUTER_MODEL,
-    OPENROUTER_BASE_URL,
-    OPENROUTER_APP_NAME,
-    OPENROUTER_SITE_URL,
-)
+from . import config
+from .config import SUMMARIES_DIR
 from .logs import logger
 from .utils import safe_open_write
 from .summaryjobs import get_job
+from .stages import executor
+from .llm import LLMClient, get_llm
+from .llm_cache import response_cache
+from .artifacts import build_artifact
+from .search import index_summary
+from .transcripts import load_segments
+from .database import journal
+from .broker import run_remote_stage
 
-from ollama import chat, ChatResponse
-from openai import OpenAI
+import asyncio
+import hashlib
+import os
 import time
 import re
-import asyncio
-import json
-import threading
-from queue import Queue, Empty
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+# Pushed onto a chunk's queue once its summary has finished streaming
+_CHUNK_DONE = object()
+
+# Pushed onto a segment feed once transcription has finished
+_FEED_END = object()
+
 system_prompt = """
 You are a YouTube transcript → markdown summarizer.
 
@@ -82,186 +82,326 @@ EXAMPLE SHAPE (guide only)
 """
 
 
-async def summarize_transcript(video_id):
-    """Summarize transcript using threading pattern to avoid blocking main thread."""
+class SegmentFeed:
+    """Hands transcript segments from a running transcription to the summarizer as they are produced.
+
+    The transcription side calls `put` for each segment and `finish` once it is done (or failed).
+    The summarizer iterates the feed with `async for`, waiting until the next segment arrives.
+    A transcription that starts over sends its segments again; the ones the feed already passed on are skipped.
+    """
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._end = -1.0
+
+    def put(self, segment: dict):
+        if segment["end"] <= self._end:
+            return
+        self._end = segment["end"]
+        self._queue.put_nowait(segment)
+
+    def finish(self, error: Exception | None = None):
+        self._queue.put_nowait(error if error else _FEED_END)
+
+    async def __aiter__(self):
+        while (item := await self._queue.get()) is not _FEED_END:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+async def summarize_transcript(
+    video_id, feed: SegmentFeed | None = None, chunking: str = "splitter", chunk_size: int | None = None
+):
+    """Summarize the transcript, streaming the summary to the job's clients as it is generated.
+
+    With a feed, chunks are summarized as soon as enough segments have been transcribed to fill them,
+    instead of reading the finished transcript from disk. `chunking` and `chunk_size` select how the
+    transcript is cut into chunks (see summary_events).
+    """
     job = get_job(video_id)
 
     if not job:
         raise ValueError("Invalid job id")
 
-    # Create queue and start worker thread
-    queue = Queue()
-    t = threading.Thread(target=summarize_worker, args=(queue, video_id), daemon=True)
-    t.start()
-
-    # Process messages from worker thread
-    while t.is_alive():
-        try:
-            data = queue.get_nowait()
-            if data["type"] == "status_update":
-                await job.update_status(data["status"], data["message"])
-            elif data["type"] == "summary_chunk":
-                # Add to summary buffer and broadcast chunk
-                await job.broadcast_data(
-                    "summary_chunk",
-                    data["data"],
-                    state_updates={
-                        "summary_buffer": job.job_state["summary_buffer"]
-                        + data["data"]["content"]
-                    },
-                    sleep_duration=0.001,  # Yield control frequently for streaming
-                )
-            elif data["type"] == "error":
-                logger.error(f"Summarization error: {data['message']}")
-                await job.update_status("error", data["message"])
-                break
-        except Empty:
-            pass
-        finally:
-            await asyncio.sleep(0.01)
+    # A feed only exists in this process, so summaries of a transcript that is still arriving are made here
+    if feed is None and config.EXECUTION_MODE == "remote":
+        events = run_remote_stage("summarize", video_id, None, chunking, chunk_size)
+    else:
+        events = summary_events(video_id, feed, chunking, chunk_size)
+
+    # Process messages from the summarizer as they arrive
+    async for data in events:
+        if data["type"] == "status_update":
+            await job.update_status(data["status"], data["message"])
+        elif data["type"] == "summary_chunk":
+            # Add to summary buffer and broadcast chunk
+            await job.append_summary(data["data"])
+        elif data["type"] == "error":
+            logger.error(f"Summarization error: {data['message']}")
+            # Raised so the job is recorded as failed and keeps its checkpoints
+            raise RuntimeError(data["message"])
 
     # Update job status to summarized on completion
     await job.update_status("summarized", "Video summarization completed")
 
 
+def format_segment(segment):
+    """Convert a segment to a timestamped transcript line for LLM consumption."""
+    # Convert seconds to MM:SS format
+    minutes = int(segment["start"] // 60)
+    seconds = int(segment["start"] % 60)
+    timestamp = f"[{minutes:02d}:{seconds:02d}]"
+    return f"{timestamp} {segment['text']}"
+
+
 def format_transcript_with_timestamps(segments):
     """Convert segments to timestamped transcript format for LLM consumption."""
-    formatted_segments = []
-    for segment in segments:
-        # Convert seconds to MM:SS format
-        minutes = int(segment["start"] // 60)
-        seconds = int(segment["start"] % 60)
-        timestamp = f"[{minutes:02d}:{seconds:02d}]"
-        formatted_segments.append(f"{timestamp} {segment['text']}")
-    return "\n".join(formatted_segments)
-
-
-def summarize_worker(queue, video_id):
-    """Worker function that runs in separate thread to do heavy summarization compute."""
+    return "\n".join(format_segment(segment) for segment in segments)
+
+
+def split_transcript(video_id: str, chunk_size: int) -> list[str]:
+    """Read a finished transcript from disk and split it into chunks of at most `chunk_size` characters."""
+    segments = load_segments(video_id)
+    if segments is None:
+        raise FileNotFoundError(f"No transcript for {video_id}")
+
+    # Create timestamped transcript format
+    full_transcript = format_transcript_with_timestamps(segments)
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=10
+    )
+
+    return splitter.split_text(full_transcript)
+
+
+async def iter_items(items: list):
+    for item in items:
+        yield item
+
+
+async def iter_transcript_chunks(segments, chunk_size: int):
+    """Group segments into chunks of at most `chunk_size` characters as the segments arrive.
+
+    Chunks break between transcript lines, so a chunk is yielded as soon as the next line would overflow it.
+    """
+    lines = []
+    length = 0
+
+    async for segment in segments:
+        line = format_segment(segment)
+
+        if lines and length + len(line) + 1 > chunk_size:
+            yield "\n".join(lines)
+            lines = []
+            length = 0
+
+        lines.append(line)
+        length += len(line) + 1
+
+    if lines:
+        yield "\n".join(lines)
+
+
+def chunk_messages(chunk: str) -> list[dict]:
+    return [
+        {
+            "role": "system",
+            "content": system_prompt,
+        },
+        {
+            "role": "user",
+            "content": f"Summarize the following video transcript: \n\n{chunk}",
+        },
+    ]
+
+
+def chunk_digest(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+async def chunk_worker(
+    llm: LLMClient,
+    chunk_queue: asyncio.Queue,
+    chunk: str,
+    index: int,
+    slots: asyncio.Semaphore,
+    checkpoint: str | None = None,
+):
+    """Summarize one chunk, pushing its tokens onto the chunk's own queue.
+
+    `checkpoint` is this chunk's summary from an interrupted run of the same job, which is replayed instead.
+    """
+    loop = asyncio.get_running_loop()
+
     try:
-        logger.info(f"Beginning summary of {video_id}")
+        if checkpoint is not None:
+            chunk_queue.put_nowait(checkpoint)
+            chunk_queue.put_nowait(_CHUNK_DONE)
+            logger.info(f"[Chunk {index}] resumed from checkpoint")
+            return
+
+        start = time.perf_counter()
+        cache_key = response_cache.key(llm.provider, llm.model(), system_prompt, chunk)
+
+        # An identical chunk was summarized before with the same provider, model and prompt; replay it at once
+        cached = await loop.run_in_executor(executor, response_cache.get, cache_key)
+        if cached is not None:
+            chunk_queue.put_nowait(cached)
+            chunk_queue.put_nowait(_CHUNK_DONE)
+            logger.info(f"[Chunk {index}] replayed from cache")
+            return
+
+        logger.info(f"Starting chunk {index}")
+        tokens = []
+
+        async for token in llm.stream(chunk_messages(chunk)):
+            tokens.append(token)
+            chunk_queue.put_nowait(token)
+
+        await loop.run_in_executor(executor, response_cache.put, cache_key, "".join(tokens))
+
+        end = time.perf_counter()
+        logger.info(f"[Chunk {index}] finished in {end - start:.2f}s")
+        chunk_queue.put_nowait(_CHUNK_DONE)
+    except Exception as e:
+        chunk_queue.put_nowait(e)
+    finally:
+        slots.release()
 
-        queue.put(
-            {
-                "type": "status_update",
-                "status": "summarizing",
-                "message": "Starting video summarization",
-            }
-        )
 
-        with open(f"{TRANS_DIR}/{video_id}.json", "r") as f:
-            segments = json.load(f)
+async def submit_chunks(
+    llm: LLMClient, chunks, checkpoints: dict, ordered: asyncio.Queue, slots: asyncio.Semaphore, tasks: list
+):
+    """Start a chunk_worker task per chunk as chunks become available, queueing their token queues in order.
 
-        # Create timestamped transcript format
-        full_transcript = format_transcript_with_timestamps(segments)
+    A checkpoint is only used if it summarizes exactly the same text, since chunk boundaries depend on the settings.
+    """
+    try:
+        i = 0
+        async for chunk in chunks:
+            await slots.acquire()
+            digest = chunk_digest(chunk)
+            checkpoint = checkpoints.get(i)
+            summary = checkpoint[1] if checkpoint and checkpoint[0] == digest else None
+
+            chunk_queue = asyncio.Queue()
+            tasks.append(asyncio.create_task(chunk_worker(llm, chunk_queue, chunk, i, slots, summary)))
+            ordered.put_nowait((i, digest, chunk_queue))
+            i += 1
+        ordered.put_nowait(None)
+    except Exception as e:
+        ordered.put_nowait(e)
 
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=MAX_CHUNK_SIZE, chunk_overlap=10
-        )
 
-        summary_path = SUMMARIES_DIR / f"{video_id}.md"
-        chunks = splitter.split_text(full_transcript)
-
-        logger.info(f"Found {len(chunks)} chunks.")
-
-        with safe_open_write(summary_path) as f:
-            for i, chunk in enumerate(chunks):
-                chunk_summary = ""
-                start = time.perf_counter()
-                logger.info(f"Starting chunk {i}")
-
-                # Use appropriate LLM provider
-                if LLM_PROVIDER == "openrouter":
-                    # OpenRouter via OpenAI client
-                    if not OPENROUTER_API_KEY:
-                        raise ValueError(
-                            "OPENROUTER_API_KEY is required when using openrouter provider"
-                        )
-
-                    client = OpenAI(
-                        api_key=OPENROUTER_API_KEY, base_url=OPENROUTER_BASE_URL
-                    )
+async def summary_events(
+    video_id, feed: SegmentFeed | None = None, chunking: str = "splitter", chunk_size: int | None = None
+):
+    """Summarize a video's transcript, yielding status updates and summary tokens as messages.
 
-                    stream = client.chat.completions.create(
-                        model=OPENROUTER_MODEL,
-                        stream=True,
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": system_prompt,
-                            },
-                            {
-                                "role": "user",
-                                "content": f"Summarize the following video transcript: \n\n{chunk}",
-                            },
-                        ],
-                        extra_headers={
-                            "HTTP-Referer": OPENROUTER_SITE_URL,
-                            "X-Title": OPENROUTER_APP_NAME,
-                        },
-                    )
+    Chunks are cut by the text splitter ("splitter"), or between transcript lines ("lines") the way they
+    are while transcription is still running. A resumed job must cut them the same way it started, or
+    none of its checkpoints would match. A feed is always cut between lines.
+    """
+    try:
+        logger.info(f"Beginning summary of {video_id}")
 
-                    for word in stream:
-                        if word.choices[0].delta.content:
-                            word_content = word.choices[0].delta.content
-                            chunk_summary += word_content
-
-                            # Send chunk data to main thread via queue
-                            queue.put(
-                                {
-                                    "type": "summary_chunk",
-                                    "data": {"content": word_content, "chunk": i},
-                                }
-                            )
-
-                else:
-                    # Default to Ollama
-                    stream = chat(
-                        model=DEFAULT_OLLAMA_MODEL,
-                        stream=True,
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": system_prompt,
-                            },
-                            {
-                                "role": "user",
-                                "content": f"Summarize the following video transcript: \n\n{chunk}",
-                            },
-                        ],
-                    )
+        yield {
+            "type": "status_update",
+            "status": "summarizing",
+            "message": "Starting video summarization",
+        }
+
+        # Settings are taken once, so a configuration change mid-summary doesn't mix providers or chunk sizes
+        llm = get_llm()
+        chunk_size = chunk_size or config.MAX_CHUNK_SIZE
+        parallelism = max(1, config.SUMMARY_PARALLELISM)
+        loop = asyncio.get_running_loop()
+        # Chunks an interrupted run of this job already summarized
+        checkpoints = await loop.run_in_executor(executor, journal.chunks, video_id)
+
+        if feed is None and chunking == "lines":
+            segments = await loop.run_in_executor(executor, load_segments, video_id)
+            if segments is None:
+                raise FileNotFoundError(f"No transcript for {video_id}")
+            chunks = iter_transcript_chunks(iter_items(segments), chunk_size)
+        elif feed is None:
+            # Reading and splitting a long transcript is CPU work, so it stays off the event loop
+            split = await loop.run_in_executor(executor, split_transcript, video_id, chunk_size)
+            logger.info(f"Found {len(split)} chunks.")
+            chunks = iter_items(split)
+        else:
+            # Chunks fill up while transcription is still running
+            chunks = iter_transcript_chunks(feed, chunk_size)
+            logger.info("Summarizing chunks as the transcript arrives.")
+
+        summary_path = SUMMARIES_DIR / f"{video_id}.md"
+        # Finished chunks are appended to a partial file, so a crash keeps what was summarized so far.
+        # It only takes the final name once complete, because an existing summary marks the video as done.
+        partial_path = summary_path.with_suffix(".md.part")
+        chunk_summaries = []
+
+        logger.info(f"Summarizing up to {parallelism} chunks at once.")
+        start = time.perf_counter()
+
+        # Up to `parallelism` chunks are sent to the provider at once, each streaming into its own queue.
+        # Queues are drained in chunk order, so the current chunk streams live while later ones buffer.
+        ordered = asyncio.Queue()
+        slots = asyncio.Semaphore(parallelism)
+        tasks = []
+        submitter = asyncio.create_task(submit_chunks(llm, chunks, checkpoints, ordered, slots, tasks))
+
+        with safe_open_write(partial_path) as summary_file:
+            try:
+                while (submitted := await ordered.get()) is not None:
+                    if isinstance(submitted, Exception):
+                        raise submitted
+
+                    i, digest, chunk_queue = submitted
+                    chunk_summary = ""
+
+                    while (word_content := await chunk_queue.get()) is not _CHUNK_DONE:
+                        if isinstance(word_content, Exception):
+                            raise word_content
 
-                    for word in stream:
-                        word_content = word["message"]["content"]
                         chunk_summary += word_content
 
-                        # Send chunk data to main thread via queue
-                        queue.put(
-                            {
-                                "type": "summary_chunk",
-                                "data": {"content": word_content, "chunk": i},
-                            }
-                        )
-
-                # If this is a thinking model, do not include the thoughts in the summary...
-                chunk_summary = re.sub(
-                    r"<think>.*?</think>", "", chunk_summary, flags=re.DOTALL
-                ).strip()
-
-                f.write(chunk_summary)
-                end = time.perf_counter()
-                logger.info(f"[Chunk {i}] finished in {end - start:.2f}s")
-
-        queue.put(
-            {
-                "type": "status_update",
-                "status": "summarized",
-                "message": "Video summarization completed",
-            }
-        )
+                        yield {
+                            "type": "summary_chunk",
+                            "data": {"content": word_content, "chunk": i},
+                        }
+
+                    # Checkpoint the finished chunk, so a restart doesn't summarize it again
+                    await loop.run_in_executor(executor, journal.save_chunk, video_id, i, digest, chunk_summary)
+
+                    # If this is a thinking model, do not include the thoughts in the summary...
+                    chunk_summaries.append(
+                        re.sub(r"<think>.*?</think>", "", chunk_summary, flags=re.DOTALL).strip()
+                    )
+                    summary_file.write(chunk_summaries[-1])
+                    summary_file.flush()
+            finally:
+                # Stops in-flight requests if summarizing failed or the consumer went away; a no-op otherwise
+                submitter.cancel()
+                for task in tasks:
+                    task.cancel()
+
+        os.replace(partial_path, summary_path)
+        await loop.run_in_executor(executor, build_artifact, "summary", video_id)
+        await loop.run_in_executor(executor, index_summary, video_id, "".join(chunk_summaries))
+
+        end = time.perf_counter()
+        logger.info(f"Summarized {len(chunk_summaries)} chunks in {end - start:.2f}s with parallelism {parallelism}")
+
+        yield {
+            "type": "status_update",
+            "status": "summarized",
+            "message": "Video summarization completed",
+        }
 
         logger.info(f"Summarized {video_id} successfully")
 
     except Exception as e:
-        logger.error(f"Error in summarization worker: {str(e)}")
-        queue.put({"type": "error", "message": f"Summarization failed: {str(e)}"})
+        logger.error(f"Error in summarization: {str(e)}")
+        yield {"type": "error", "message": f"Summarization failed: {str(e)}"}
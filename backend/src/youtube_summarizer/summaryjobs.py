@@ -2,22 +2,72 @@ import asyncio
 import uuid
 import json
 
+from .batching import TokenBatcher
+from .subscribers import Subscriber
+
+# Events a lagging client must still get, even when its queued data events are dropped
+CONTROL_EVENTS = {"status_update", "error"}
+
+
+class AppendLog:
+    """Append-only list of items that keeps a cached JSON encoding of everything appended so far.
+
+    Each item is encoded once when it is appended. The joined encoding is only extended with the
+    items added since the last read, so building a snapshot never re-encodes old items.
+    """
+
+    def __init__(self, separator: str):
+        self.items = []
+        self._encoded: list[str] = []
+        self._separator = separator
+        self._joined = ""
+        self._joined_count = 0
+
+    def append(self, item, encoded: str):
+        self.items.append(item)
+        self._encoded.append(encoded)
+
+    def joined(self) -> str:
+        if self._joined_count < len(self._encoded):
+            new_parts = self._separator.join(self._encoded[self._joined_count:])
+            if self._joined_count:
+                self._joined += self._separator + new_parts
+            else:
+                self._joined = new_parts
+            self._joined_count = len(self._encoded)
+        return self._joined
+
+    def __len__(self):
+        return len(self.items)
+
 
 class SummaryJob:
     def __init__(self, video_id: str):
-        self.clients: dict[str, asyncio.Queue] = {}
+        self.video_id = video_id
+        self.clients: dict[str, Subscriber] = {}
+        # Small scalar fields. The growing buffers live in the append logs below.
         self.job_state = {
             "status": "starting",
             "download_progress": 0,
-            "transcript_buffer": [],
             "video": None,
-            "summary_buffer": "",
         }
-
-    async def broadcast(self, event, sleep_duration=0.01):
-        for client in self.clients.values():
-            await client.put(event)
-        await asyncio.sleep(sleep_duration)
+        # Transcript segments are encoded as JSON objects, summary tokens as the inside of a JSON string
+        self.transcript_log = AppendLog(", ")
+        self.summary_log = AppendLog("")
+        # Summary tokens are coalesced per chunk before being appended and broadcast
+        self.summary_batcher = TokenBatcher(self._flush_summary)
+        self._batch_chunk = None
+
+    async def broadcast(self, event):
+        # Pending summary tokens always go out before whatever event follows them
+        await self.summary_batcher.flush()
+        self._send(event)
+
+    def _send(self, event):
+        # Offering never waits, so a slow client can't delay the job or the other clients
+        for client_id, client in list(self.clients.items()):
+            if not client.offer(event, control=event["type"] in CONTROL_EVENTS):
+                self.remove_client(client_id)
 
     async def update_status(self, status: str, message: str):
         """Update job status and broadcast status_update event."""
@@ -31,28 +81,62 @@ class SummaryJob:
         event_type: str,
         data: dict,
         state_updates: dict = {},
-        sleep_duration=0.01,
     ):
         """Broadcast event with optional state updates."""
         if state_updates:
             self.job_state.update(state_updates)
-        await self.broadcast({"type": event_type, "data": data}, sleep_duration)
+        await self.broadcast({"type": event_type, "data": data})
+
+    async def append_transcript_segment(self, segment: dict):
+        """Append a segment to the transcript buffer and broadcast it."""
+        self.transcript_log.append(segment, json.dumps(segment))
+        await self.broadcast({"type": "transcript_segment", "data": segment})
+
+    async def append_summary(self, data: dict):
+        """Queue streamed summary content to be appended to the summary buffer and broadcast in batches."""
+        if data["chunk"] != self._batch_chunk:
+            await self.summary_batcher.flush()
+            self._batch_chunk = data["chunk"]
+        await self.summary_batcher.add(data["content"])
+
+    async def _flush_summary(self, content: str):
+        # json.dumps escapes character by character, so the escaped bodies of consecutive batches concatenate cleanly
+        self.summary_log.append(content, json.dumps(content)[1:-1])
+        self._send({"type": "summary_chunk", "data": {"content": content, "chunk": self._batch_chunk}})
+
+    async def restart_stage(self, stage: str):
+        """Drop what a stage streamed so far because it is starting over, and send clients the state again."""
+        if stage == "transcribe":
+            self.transcript_log = AppendLog(", ")
+        elif stage == "summarize":
+            await self.summary_batcher.flush()
+            self.summary_log = AppendLog("")
+            self._batch_chunk = None
+
+        for client_id, client in list(self.clients.items()):
+            if not client.resync():
+                self.remove_client(client_id)
 
     def add_client(self):
         id = str(uuid.uuid4())
-        new_q = asyncio.Queue()
-        self.clients[id] = new_q
-        return id, new_q
+        subscriber = Subscriber()
+        self.clients[id] = subscriber
+        return id, subscriber
 
     def remove_client(self, client_id):
-        del self.clients[client_id]
+        self.clients.pop(client_id, None)
 
     def get_state(self):
-        return json.dumps(self.job_state)
+        # Only the scalar fields are serialized per call; the buffers come from the append log caches
+        scalars = json.dumps(self.job_state)
+        return (
+            f'{scalars[:-1]}, "transcript_buffer": [{self.transcript_log.joined()}], '
+            f'"summary_buffer": "{self.summary_log.joined()}"}}'
+        )
 
     async def close(self):
         for client in self.clients.values():
-            await client.put("close")
+            client.close()
         await asyncio.sleep(0.01)
 
 
@@ -65,6 +149,17 @@ def create_job(video_id: str):
     return new_job
 
 
+def claim_job(video_id: str):
+    """Create a job for the video unless one is already running, in which case None is returned.
+
+    Call it on the event loop: nothing awaits between the check and the create, so two requests for the
+    same video can't both start a pipeline.
+    """
+    if video_id in jobs:
+        return None
+    return create_job(video_id)
+
+
 async def close_job(video_id: str):
     await jobs[video_id].close()
     del jobs[video_id]
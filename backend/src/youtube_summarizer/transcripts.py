@@ -0,0 +1,140 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .config import TRANS_DIR
+from .logs import logger
+
+# Layout of a transcript file, all little-endian:
+#   header    magic, format version, segment count, text blob size (padded to 24 bytes)
+#   starts    float64 per segment
+#   ends      float64 per segment
+#   offsets   uint64 per segment, plus one, locating each segment's text in the blob
+#   text      UTF-8 text of every segment, back to back
+MAGIC = b"YTSG"
+VERSION = 1
+HEADER = struct.Struct("<4sIIQ4x")
+
+
+def transcript_file(video_id: str) -> Path:
+    return Path(TRANS_DIR) / f"{video_id}.seg"
+
+
+def legacy_transcript_file(video_id: str) -> Path:
+    """JSON transcripts written before the binary format; still read, and converted on first use."""
+    return Path(TRANS_DIR) / f"{video_id}.json"
+
+
+def transcript_path(video_id: str) -> Path | None:
+    """The video's transcript file in whichever format it exists, or None."""
+    for path in (transcript_file(video_id), legacy_transcript_file(video_id)):
+        if path.exists():
+            return path
+    return None
+
+
+def write_transcript(path, segments: list[dict]):
+    """Write segments in the binary transcript format, replacing any existing file atomically."""
+    texts = [segment["text"].encode("utf-8") for segment in segments]
+    offsets = np.zeros(len(texts) + 1, dtype="<u8")
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(segments), int(offsets[-1])))
+        f.write(np.array([segment["start"] for segment in segments], dtype="<f8").tobytes())
+        f.write(np.array([segment["end"] for segment in segments], dtype="<f8").tobytes())
+        f.write(offsets.tobytes())
+        f.write(b"".join(texts))
+
+    os.replace(tmp_path, path)
+
+
+class Transcript:
+    """A memory-mapped transcript. Only the segments that are read are decoded.
+
+    Close it, or use it as a context manager, to release the mapping and its file descriptor.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, text_size = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} transcript file")
+
+        offset = HEADER.size
+        self.starts = np.frombuffer(self._map, dtype="<f8", count=count, offset=offset)
+        offset += 8 * count
+        self.ends = np.frombuffer(self._map, dtype="<f8", count=count, offset=offset)
+        offset += 8 * count
+        self._offsets = np.frombuffer(self._map, dtype="<u8", count=count + 1, offset=offset)
+        self._text_start = offset + 8 * (count + 1)
+
+    def close(self):
+        # The arrays are views of the mapping, which can't be closed while they exist
+        self.starts = self.ends = self._offsets = None
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def segment(self, i: int) -> dict:
+        text = self._map[self._text_start + int(self._offsets[i]):self._text_start + int(self._offsets[i + 1])]
+        return {"start": float(self.starts[i]), "end": float(self.ends[i]), "text": text.decode("utf-8")}
+
+    def segments(self, start: int = 0, stop: int | None = None) -> list[dict]:
+        stop = len(self) if stop is None else stop
+        return [self.segment(i) for i in range(start, stop)]
+
+    def between(self, time_from: float | None = None, time_to: float | None = None) -> list[dict]:
+        """Segments that overlap the time range, found by binary search on the packed timestamps."""
+        # Segments are in time order, so both arrays are sorted
+        first = 0 if time_from is None else int(np.searchsorted(self.ends, time_from, side="right"))
+        stop = len(self) if time_to is None else int(np.searchsorted(self.starts, time_to, side="left"))
+        return self.segments(first, max(first, stop))
+
+
+def open_transcript(video_id: str) -> Transcript | None:
+    """Open the video's transcript, converting a legacy JSON transcript to the binary format first."""
+    path = transcript_file(video_id)
+
+    if not path.exists():
+        legacy = legacy_transcript_file(video_id)
+        if not legacy.exists():
+            return None
+
+        with open(legacy, "r", encoding="utf-8") as f:
+            write_transcript(path, json.load(f))
+        logger.info(f"Converted the JSON transcript of {video_id} to the binary format")
+
+    return Transcript(path)
+
+
+def load_segments(video_id: str) -> list[dict] | None:
+    transcript = open_transcript(video_id)
+    if not transcript:
+        return None
+
+    with transcript:
+        return transcript.segments()
+
+
+def remove_transcript(video_id: str):
+    for path in (transcript_file(video_id), legacy_transcript_file(video_id)):
+        path.unlink(missing_ok=True)
@@ -1,12 +1,26 @@
 import re
+import os
 from .config import DOWNLOAD_DIR
 from pathlib import Path
 
+# Every extension a stored audio file can have, depending on the AUDIO_FORMAT it was saved with
+AUDIO_EXTENSIONS = ("mp3", "webm", "m4a", "mp4", "opus", "ogg", "mka")
+
 def get_file_path(video_id: str):
-    """Returns the file path for the audio file of a YouTube video."""
+    """Returns the file path for the audio file of a YouTube video, without its extension."""
 
     return f"{DOWNLOAD_DIR}/{video_id}"
 
+def find_audio_file(video_id: str):
+    """Returns the path of the video's stored audio file, whatever format it was saved in, or None."""
+    path = get_file_path(video_id)
+
+    for ext in AUDIO_EXTENSIONS:
+        if os.path.exists(f"{path}.{ext}"):
+            return f"{path}.{ext}"
+
+    return None
+
 def extract_url_id(video_url: str):
     """Extracts the video ID from a YouTube URL."""
     patterns = [
@@ -0,0 +1,158 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from . import config
+from .config_manager import config_manager
+from .logs import logger
+
+# Configuration keys a loaded model depends on; changing any of them retires the loaded models
+MODEL_KEYS = {"WHISPER_MODEL", "WHISPER_DEVICE", "WHISPER_COMPUTE_TYPE", "WHISPER_CPU_THREADS", "WHISPER_NUM_WORKERS"}
+
+
+def resolve_device(device: str | None) -> str:
+    """Turn "auto" (or nothing) into cuda when a GPU is visible, cpu otherwise."""
+    if device and device != "auto":
+        return device
+
+    import ctranslate2
+
+    return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+
+class LoadedModel:
+    def __init__(self, model):
+        self.model = model
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+class ModelRegistry:
+    """Loads Whisper models on first use and caches them by (name, device, compute type).
+
+    Models that nobody has used for `idle_seconds` are unloaded by a background reaper, so switching
+    models doesn't keep the old one in (GPU) memory forever. Set `idle_seconds` to 0 to never unload.
+    Without `idle_seconds`, the configured WHISPER_IDLE_UNLOAD_SECONDS applies.
+    """
+
+    def __init__(self, idle_seconds: int | None = None):
+        self._idle_seconds = idle_seconds
+        self._models: dict[tuple, LoadedModel] = {}
+        self._lock = threading.Lock()
+        # One lock per key, so loading one model doesn't block users of another
+        self._load_locks: dict[tuple, threading.Lock] = {}
+        self._reaper: threading.Thread | None = None
+
+    @property
+    def idle_seconds(self) -> int:
+        return config.WHISPER_IDLE_UNLOAD_SECONDS if self._idle_seconds is None else self._idle_seconds
+
+    def key(self, name=None, device=None, compute_type=None) -> tuple:
+        return (
+            name or config.DEFAULT_TRANS_MODEL,
+            resolve_device(device or config.DEFAULT_TRANS_DEVICE),
+            compute_type or config.DEFAULT_TRANS_COMPUTE_TYPE,
+        )
+
+    def _load(self, key: tuple) -> LoadedModel:
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    return self._models[key]
+
+            from faster_whisper import WhisperModel
+
+            name, device, compute_type = key
+            logger.info(f"Loading whisper model {name} on {device} ({compute_type})")
+            start = time.perf_counter()
+            model = WhisperModel(
+                name,
+                device=device,
+                compute_type=compute_type,
+                cpu_threads=config.WHISPER_CPU_THREADS,
+                num_workers=config.WHISPER_NUM_WORKERS,
+            )
+            logger.info(f"Loaded whisper model {name} in {time.perf_counter() - start:.2f}s")
+
+            with self._lock:
+                self._models[key] = LoadedModel(model)
+                self._start_reaper()
+                return self._models[key]
+
+    @contextmanager
+    def use(self, name=None, device=None, compute_type=None):
+        """Borrow a model for the duration of the block, loading it first if needed. Borrowed models are never unloaded."""
+        key = self.key(name, device, compute_type)
+
+        with self._lock:
+            entry = self._models.get(key)
+            if entry:
+                entry.users += 1
+
+        if not entry:
+            entry = self._load(key)
+            with self._lock:
+                entry.users += 1
+
+        try:
+            yield entry.model
+        finally:
+            with self._lock:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+
+    def warm_up(self, name=None, device=None, compute_type=None):
+        """Load a model ahead of its first use."""
+        self._load(self.key(name, device, compute_type))
+
+    def loaded(self) -> list[tuple]:
+        with self._lock:
+            return list(self._models.keys())
+
+    def retire_all(self):
+        """Forget every loaded model, so the next transcription loads one with the current settings.
+
+        Transcriptions that are using a model keep their reference and finish on it; it is freed once they let go.
+        """
+        with self._lock:
+            for key in list(self._models):
+                logger.info(f"Retiring whisper model {key[0]} on {key[1]} ({key[2]})")
+                del self._models[key]
+
+    def unload_idle(self):
+        if self.idle_seconds <= 0:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in list(self._models.items()):
+                if entry.users == 0 and now - entry.last_used >= self.idle_seconds:
+                    logger.info(f"Unloading idle whisper model {key[0]} on {key[1]} ({key[2]})")
+                    del self._models[key]
+
+    def _start_reaper(self):
+        if self.idle_seconds <= 0 or self._reaper:
+            return
+
+        def reap():
+            while True:
+                # The setting can change while the reaper runs; 0 means models stay loaded
+                time.sleep(min(self.idle_seconds, 60) if self.idle_seconds > 0 else 60)
+                self.unload_idle()
+
+        self._reaper = threading.Thread(target=reap, name="whisper-reaper", daemon=True)
+        self._reaper.start()
+
+
+models = ModelRegistry()
+
+
+def _reload(changed: dict):
+    if MODEL_KEYS & changed.keys():
+        models.retire_all()
+
+
+config_manager.on_change(_reload)
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import socket
+
+from . import broker
+from .batching import TokenBatcher
+from .config_manager import config_manager
+from .download import youtube_dl
+from .logs import logger
+from .scheduler import stage_limits
+from .scribe import transcribe_worker
+from .stages import executor
+from .summarize import summary_events
+
+# Blocking stage workers, called as `worker(queue, *args)` like the API node runs them locally
+THREAD_STAGES = {
+    "download": youtube_dl,
+    "transcribe": transcribe_worker,
+}
+
+STAGES = (*THREAD_STAGES, "summarize")
+
+
+class TaskLost(RuntimeError):
+    """The task was handed to another worker after this one stopped sending heartbeats."""
+
+
+class TaskQueue:
+    """Hands a stage worker's messages to the broker, where the API node picks them up."""
+
+    def __init__(self, task: dict):
+        self.task_id = task["id"]
+        self.owner = task["owner"]
+
+    def put(self, item):
+        # Raising stops the stage at its next message instead of letting two workers write the same files
+        if not broker.emit(self.task_id, self.owner, item):
+            raise TaskLost(f"Task {self.task_id} belongs to another worker now")
+
+
+class SummaryRelay:
+    """Sends a summarize task's messages to the broker, with its tokens coalesced per chunk first.
+
+    Without this every token would be its own database write. Writes run in the stage executor one at a
+    time, so messages keep their order.
+    """
+
+    def __init__(self, task: dict):
+        self.queue = TaskQueue(task)
+        self.batcher = TokenBatcher(self._flush_tokens)
+        self._chunk = None
+        self._lock = asyncio.Lock()
+
+    async def send(self, data: dict):
+        if data["type"] == "summary_chunk":
+            if data["data"]["chunk"] != self._chunk:
+                await self.batcher.flush()
+                self._chunk = data["data"]["chunk"]
+            await self.batcher.add(data["data"]["content"])
+        else:
+            await self.batcher.flush()
+            await self._emit(data)
+
+    async def _flush_tokens(self, content: str):
+        await self._emit({"type": "summary_chunk", "data": {"content": content, "chunk": self._chunk}})
+
+    async def _emit(self, event: dict):
+        async with self._lock:
+            await asyncio.get_running_loop().run_in_executor(executor, self.queue.put, event)
+
+
+async def keep_alive(task: dict):
+    while True:
+        await asyncio.sleep(broker.HEARTBEAT_SECONDS)
+        alive = await asyncio.get_running_loop().run_in_executor(executor, broker.heartbeat, task["id"], task["owner"])
+        if not alive:
+            return
+
+
+async def run_task(task: dict):
+    loop = asyncio.get_running_loop()
+    stage, args = task["stage"], task["args"]
+    heartbeats = asyncio.create_task(keep_alive(task))
+    error = None
+
+    logger.info(f"Running {stage} task {task['id']} for {args[0]}")
+
+    try:
+        if stage in THREAD_STAGES:
+            await loop.run_in_executor(executor, THREAD_STAGES[stage], TaskQueue(task), *args)
+        else:
+            relay = SummaryRelay(task)
+            async for data in summary_events(*args):
+                await relay.send(data)
+            await relay.batcher.flush()
+    except Exception as e:
+        logger.error(f"{stage} task {task['id']} failed: {e}")
+        error = str(e)
+    finally:
+        heartbeats.cancel()
+
+    await loop.run_in_executor(executor, broker.finish, task["id"], task["owner"], error)
+
+
+async def serve(stages: list[str]):
+    """Take tasks of the given stages from the broker and run them, up to each stage's concurrency limit."""
+    loop = asyncio.get_running_loop()
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    running: set[asyncio.Task] = set()
+
+    logger.info(f"Worker {name} is taking {', '.join(stages)} tasks")
+
+    while True:
+        # Settings saved by the API node apply from the next task on
+        config_manager.refresh()
+        await loop.run_in_executor(executor, broker.requeue_stale)
+
+        free = [stage for stage in stages if not stage_limits[stage].locked()]
+        task = await loop.run_in_executor(executor, broker.claim, name, free)
+
+        if not task:
+            await asyncio.sleep(broker.POLL_SECONDS * 5)
+            continue
+
+        limit = stage_limits[task["stage"]]
+        await limit.acquire()
+
+        def done(finished, limit=limit):
+            limit.release()
+            running.discard(finished)
+
+        runner = asyncio.create_task(run_task(task))
+        running.add(runner)
+        runner.add_done_callback(done)
+
+
+def run(stages: list[str]):
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}. Choose from {', '.join(STAGES)}")
+
+    asyncio.run(serve(stages))
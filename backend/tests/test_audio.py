@@ -0,0 +1,158 @@
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+from youtube_summarizer.audio import (
+    SAMPLE_RATE,
+    DrainedPipe,
+    StderrTail,
+    iter_pcm_windows,
+    open_pcm_stream,
+    storage_encoding,
+    transcode,
+)
+
+
+def tone(seconds: float, rate: int = SAMPLE_RATE) -> np.ndarray:
+    """A 440 Hz tone with a silent gap every 3 seconds, as 16-bit samples."""
+    t = np.arange(int(seconds * rate)) / rate
+    samples = 0.5 * np.sin(2 * np.pi * 440 * t)
+    samples[(t % 3) > 2.5] = 0
+    return (samples * 32767).astype(np.int16)
+
+
+def write_wav(path: str, samples: np.ndarray, rate: int, channels: int = 1):
+    with wave.open(path, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(np.repeat(samples, channels).tobytes())
+
+
+def close_pipes(process):
+    process.stdout.close()
+    process.stderr.close()
+
+
+class PcmWindowTests(unittest.TestCase):
+    def test_windows_cover_the_stream_without_gaps(self):
+        samples = tone(20)
+        pipe = DrainedPipe(io.BufferedReader(io.BytesIO(samples.tobytes())), read_size=4096)
+
+        windows = list(iter_pcm_windows(pipe, window_seconds=6, search_seconds=1))
+
+        offset = 0.0
+        for start, window in windows:
+            self.assertAlmostEqual(start, offset)
+            self.assertLessEqual(len(window), 6 * SAMPLE_RATE)
+            offset += len(window) / SAMPLE_RATE
+        self.assertEqual(sum(len(window) for _, window in windows), len(samples))
+
+    def test_bounded_drain_still_delivers_everything(self):
+        data = tone(5).tobytes()
+        # Room for a single chunk, so the draining thread has to wait for the reader
+        pipe = DrainedPipe(io.BufferedReader(io.BytesIO(data)), read_size=1024, max_buffered=1024)
+
+        received = b""
+        while chunk := pipe.read(3000):
+            received += chunk
+        self.assertEqual(received, data)
+
+    def test_close_frees_a_waiting_drain(self):
+        pipe = DrainedPipe(io.BufferedReader(io.BytesIO(tone(5).tobytes())), read_size=1024, max_buffered=1024)
+        pipe.read(1024)
+        pipe.close()
+        self.assertTrue(pipe._chunks.empty())
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg is not installed")
+class LocalStreamTests(unittest.TestCase):
+    """Feeds a local media file through the same ffmpeg pipeline used for remote streams."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.dir.name, "source.wav")
+        # Stereo 44.1 kHz, so the stream has to be downmixed and resampled for whisper
+        write_wav(self.source, tone(12, rate=44100), rate=44100, channels=2)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_local_file_is_decoded_and_persisted(self):
+        ext, persist_args = storage_encoding("mono16k", "wav")
+        persist_path = os.path.join(self.dir.name, f"audio.{ext}")
+
+        process = open_pcm_stream(self.source, persist_path, persist_args)
+        self.addCleanup(close_pipes, process)
+        errors = StderrTail(process.stderr)
+        windows = list(iter_pcm_windows(DrainedPipe(process.stdout), window_seconds=5, search_seconds=1))
+
+        self.assertEqual(process.wait(), 0, errors.text())
+        decoded = sum(len(window) for _, window in windows)
+        self.assertAlmostEqual(decoded / SAMPLE_RATE, 12, delta=0.1)
+        self.assertGreater(os.path.getsize(persist_path), 0)
+
+    def test_ffmpeg_errors_are_reported(self):
+        process = open_pcm_stream(os.path.join(self.dir.name, "missing.wav"), os.devnull, ["-f", "null"])
+        self.addCleanup(close_pipes, process)
+        errors = StderrTail(process.stderr)
+        list(iter_pcm_windows(DrainedPipe(process.stdout), window_seconds=5))
+
+        self.assertNotEqual(process.wait(), 0)
+        self.assertIn("missing.wav", errors.text())
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg is not installed")
+class TranscodeTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        wav = os.path.join(self.dir.name, "source.wav")
+        write_wav(wav, tone(10, rate=48000), rate=48000, channels=2)
+        # What YouTube usually serves as bestaudio: stereo opus at 48 kHz in webm
+        self.source = os.path.join(self.dir.name, "video.webm")
+        transcode(wav, self.source, ["-c:a", "libopus", "-b:a", "128k", "-f", "webm"])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def probe(self, path: str) -> str:
+        result = subprocess.run(["ffmpeg", "-nostdin", "-i", path], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return result.stderr.decode()
+
+    def test_mono16k_reencodes_opus_sources(self):
+        ext, args = storage_encoding("mono16k", "webm")
+        dest = os.path.join(self.dir.name, f"video.{ext}")
+
+        transcode(self.source, dest, args)
+
+        self.assertIn("mono", self.probe(dest))
+        # 24 kbps for 10 seconds is about 30 KB, where a stream copy would keep the 128 kbps source
+        self.assertLess(os.path.getsize(dest), 50_000)
+        self.assertLess(os.path.getsize(dest), os.path.getsize(self.source) / 2)
+
+    def test_transcode_in_place(self):
+        ext, args = storage_encoding("mono16k", "opus")
+        dest = os.path.join(self.dir.name, f"video.{ext}")
+        transcode(self.source, dest, args)
+        size = os.path.getsize(dest)
+
+        transcode(dest, dest, args)
+
+        self.assertAlmostEqual(os.path.getsize(dest), size, delta=size * 0.2)
+        self.assertFalse(os.path.exists(dest + ".part"))
+
+    def test_failures_leave_no_partial_file(self):
+        dest = os.path.join(self.dir.name, "broken.opus")
+        with self.assertRaises(RuntimeError):
+            transcode(os.path.join(self.dir.name, "missing.webm"), dest, storage_encoding("mono16k", "webm")[1])
+        self.assertFalse(os.path.exists(dest + ".part"))
+
+
+if __name__ == "__main__":
+    unittest.main()
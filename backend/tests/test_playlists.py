@@ -0,0 +1,109 @@
+import json
+import os
+import unittest
+
+from youtube_summarizer.playlists import expand_urls, playlist_id
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "yt_dlp")
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLfIxTuRe0000000000000000000000001"
+UNAVAILABLE_URL = "https://www.youtube.com/playlist?list=PLfIxTuRe0000000000000000000000002"
+EMPTY_URL = "https://www.youtube.com/playlist?list=PLfIxTuRe0000000000000000000000003"
+CHANNEL_URL = "https://www.youtube.com/@fixturechannel"
+
+# Flat-extraction output recorded from yt-dlp, by the URL it was extracted from
+RECORDINGS = {
+    PLAYLIST_URL: "playlist.json",
+    UNAVAILABLE_URL: "playlist_unavailable.json",
+    EMPTY_URL: "playlist_empty.json",
+    CHANNEL_URL: "channel.json",
+    f"{CHANNEL_URL}/videos": "channel_videos.json",
+    f"{CHANNEL_URL}/shorts": "channel_shorts.json",
+}
+
+
+class RecordedExtractor:
+    """Stands in for yt-dlp, answering from the recorded fixtures and remembering what was asked for."""
+
+    def __init__(self):
+        self.requested = []
+
+    def __call__(self, url: str) -> dict:
+        self.requested.append(url)
+        if url not in RECORDINGS:
+            raise RuntimeError(f"ERROR: [youtube:tab] Unable to recognize tab page: {url}")
+        with open(os.path.join(FIXTURES, RECORDINGS[url])) as f:
+            return json.load(f)
+
+
+class ExpandUrlsTests(unittest.TestCase):
+    def setUp(self):
+        self.extract = RecordedExtractor()
+
+    def test_playlist_is_expanded_in_order_without_duplicates(self):
+        video_ids, errors = expand_urls([PLAYLIST_URL], self.extract)
+
+        self.assertEqual(video_ids, ["Xq3Fh1kP9aA", "b7Lm2RtQ0cE", "Zp0o9Ku8JnB"])
+        self.assertEqual(errors, {})
+
+    def test_channel_tabs_are_followed(self):
+        video_ids, errors = expand_urls([CHANNEL_URL], self.extract)
+
+        self.assertEqual(
+            video_ids, ["Jk4Tn7Wq2sD", "b7Lm2RtQ0cE", "Rr8Vb3Np6mF", "Sh0rt1aBcDe", "Sh0rt2fGhIj"]
+        )
+        self.assertEqual(self.extract.requested, [CHANNEL_URL, f"{CHANNEL_URL}/videos", f"{CHANNEL_URL}/shorts"])
+        self.assertEqual(errors, {})
+
+    def test_private_deleted_and_empty_entries_are_skipped(self):
+        video_ids, errors = expand_urls([UNAVAILABLE_URL, EMPTY_URL], self.extract)
+
+        self.assertEqual(video_ids, ["Av4iLaBle01", "Av4iLaBle02"])
+        self.assertEqual(errors, {})
+
+    def test_single_videos_need_no_extraction(self):
+        video_ids, _ = expand_urls(
+            ["https://www.youtube.com/watch?v=Xq3Fh1kP9aA", " https://youtu.be/Jk4Tn7Wq2sD ", ""], self.extract
+        )
+
+        self.assertEqual(video_ids, ["Xq3Fh1kP9aA", "Jk4Tn7Wq2sD"])
+        self.assertEqual(self.extract.requested, [])
+
+    def test_video_opened_from_a_playlist_expands_the_playlist(self):
+        url = "https://www.youtube.com/watch?v=b7Lm2RtQ0cE&list=PLfIxTuRe0000000000000000000000001&index=2"
+
+        video_ids, _ = expand_urls([url], self.extract)
+
+        self.assertEqual(video_ids, ["Xq3Fh1kP9aA", "b7Lm2RtQ0cE", "Zp0o9Ku8JnB"])
+        self.assertEqual(self.extract.requested, [PLAYLIST_URL])
+
+    def test_mixed_urls_are_deduplicated_across_sources(self):
+        video_ids, _ = expand_urls(
+            ["https://www.youtube.com/watch?v=Rr8Vb3Np6mF", PLAYLIST_URL, CHANNEL_URL], self.extract
+        )
+
+        self.assertEqual(
+            video_ids,
+            ["Rr8Vb3Np6mF", "Xq3Fh1kP9aA", "b7Lm2RtQ0cE", "Zp0o9Ku8JnB", "Jk4Tn7Wq2sD", "Sh0rt1aBcDe", "Sh0rt2fGhIj"],
+        )
+
+    def test_failed_urls_are_reported_without_stopping_the_rest(self):
+        broken = "https://www.youtube.com/@missingchannel"
+
+        video_ids, errors = expand_urls([broken, PLAYLIST_URL], self.extract)
+
+        self.assertEqual(video_ids, ["Xq3Fh1kP9aA", "b7Lm2RtQ0cE", "Zp0o9Ku8JnB"])
+        self.assertEqual(list(errors), [broken])
+        self.assertIn("Unable to recognize", errors[broken])
+
+
+class PlaylistIdTests(unittest.TestCase):
+    def test_playlist_id(self):
+        self.assertEqual(playlist_id(PLAYLIST_URL), "PLfIxTuRe0000000000000000000000001")
+        self.assertEqual(playlist_id("https://www.youtube.com/watch?v=b7Lm2RtQ0cE&list=PLabc"), "PLabc")
+        self.assertIsNone(playlist_id("https://www.youtube.com/watch?v=b7Lm2RtQ0cE"))
+        self.assertIsNone(playlist_id(CHANNEL_URL))
+
+
+if __name__ == "__main__":
+    unittest.main()
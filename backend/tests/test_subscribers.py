@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+
+from youtube_summarizer.batchjobs import BatchJob
+from youtube_summarizer.subscribers import RESYNC, Subscriber
+from youtube_summarizer.summaryjobs import SummaryJob
+
+
+async def drain(subscriber: Subscriber) -> list:
+    """Read events the way the SSE streams do, until the subscriber is closed."""
+    events = []
+    while (event := await asyncio.wait_for(subscriber.get(), 1)) != "close":
+        events.append(event)
+    return events
+
+
+def event_types(events: list) -> list:
+    return [event if event is RESYNC else event["type"] for event in events]
+
+
+class ClosedJobTests(unittest.IsolatedAsyncioTestCase):
+    async def test_finished_job_delivers_its_last_events(self):
+        job = SummaryJob("video")
+        _, subscriber = job.add_client()
+
+        await job.update_status("transcribing", "Starting audio transcription")
+        await job.update_status("success", "Video has been summarized successfully")
+        await job.close()
+
+        events = await drain(subscriber)
+        self.assertEqual([event["data"]["status"] for event in events], ["transcribing", "success"])
+
+    async def test_failed_job_delivers_its_error(self):
+        job = SummaryJob("video")
+        _, subscriber = job.add_client()
+
+        await job.append_summary({"content": "Partial", "chunk": 0})
+        await job.broadcast_data("error", {"error": "boom"}, state_updates={"status": "error"})
+        await job.close()
+
+        self.assertEqual(event_types(await drain(subscriber)), ["summary_chunk", "error"])
+
+    async def test_finished_batch_delivers_done(self):
+        batch = BatchJob("batch")
+        _, subscriber = batch.add_client()
+
+        await batch.expanded({"a": "queued"}, {})
+        await batch.update_video("a", "done")
+        await batch.finish("done")
+        await batch.close()
+
+        events = await drain(subscriber)
+        self.assertEqual(event_types(events), ["expanded", "video_update", "status_update"])
+        self.assertEqual(events[-1]["data"]["status"], "done")
+
+
+class CloseTests(unittest.IsolatedAsyncioTestCase):
+    async def test_full_queue_drops_data_to_make_room(self):
+        subscriber = Subscriber(maxsize=3, policy="drop_oldest")
+        subscriber.offer({"type": "summary_chunk"})
+        subscriber.offer({"type": "status_update"}, control=True)
+        subscriber.offer({"type": "summary_chunk"})
+
+        subscriber.close()
+
+        self.assertEqual(event_types(await drain(subscriber)), ["status_update", "summary_chunk"])
+
+    async def test_queue_of_control_events_is_kept_whole(self):
+        subscriber = Subscriber(maxsize=2, policy="drop_oldest")
+        subscriber.offer({"type": "status_update"}, control=True)
+        subscriber.offer({"type": "error"}, control=True)
+
+        subscriber.close()
+
+        self.assertEqual(event_types(await drain(subscriber)), ["status_update", "error"])
+
+    async def test_close_wakes_a_waiting_reader(self):
+        subscriber = Subscriber(maxsize=2)
+        reader = asyncio.create_task(subscriber.get())
+        await asyncio.sleep(0)
+
+        subscriber.close()
+
+        self.assertEqual(await asyncio.wait_for(reader, 1), "close")
+
+    async def test_disconnected_slow_client_keeps_control_events(self):
+        subscriber = Subscriber(maxsize=2, policy="disconnect")
+        subscriber.offer({"type": "summary_chunk"})
+        subscriber.offer({"type": "status_update"}, control=True)
+
+        self.assertFalse(subscriber.offer({"type": "summary_chunk"}))
+        self.assertEqual(event_types(await drain(subscriber)), ["status_update"])
+
+
+if __name__ == "__main__":
+    unittest.main()